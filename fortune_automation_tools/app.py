@@ -1,16 +1,30 @@
 import os
 import sys
+import numpy as np
 import pandas as pd
 import fitz  # PyMuPDF
 import pdfplumber
 import logging
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, send_file, send_from_directory, session, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, send_file, send_from_directory, session, redirect, url_for, stream_with_context
 from werkzeug.utils import secure_filename
 import uuid
 import shutil
 import zipfile
+import bisect
+import io
 import threading
+import time
+import multiprocessing
+import hashlib
+import hmac
+import pickle
+import json
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
 from functools import wraps
 
 # Helper function to get the correct path for bundled resources
@@ -42,19 +56,358 @@ app.secret_key = 'your-secret-key-here'  # Replace with a secure key in producti
 UPLOAD_FOLDER = 'uploads'
 OUTPUT_FOLDER = 'outputs'
 LOG_FOLDER = 'logs'
+CACHE_FOLDER = 'cache'
 # Use get_output_base_path to ensure folders are created in the correct location
 BASE_PATH = get_output_base_path()
 os.makedirs(os.path.join(BASE_PATH, UPLOAD_FOLDER), exist_ok=True)
 os.makedirs(os.path.join(BASE_PATH, OUTPUT_FOLDER), exist_ok=True)
 os.makedirs(os.path.join(BASE_PATH, LOG_FOLDER), exist_ok=True)
+os.makedirs(os.path.join(BASE_PATH, CACHE_FOLDER), exist_ok=True)
 app.config['UPLOAD_FOLDER'] = os.path.join(BASE_PATH, UPLOAD_FOLDER)
 ALLOWED_EXTENSIONS = {'xlsx', 'pdf'}
+# Number of worker processes used to render site PDFs (1 = serial, in the job thread)
+app.config['HIGHLIGHT_WORKERS'] = int(os.environ.get('HIGHLIGHT_WORKERS', '1'))
+# Number of worker processes reading PF ECR pages (1 = serial, in the job thread)
+app.config['PF_EXTRACT_WORKERS'] = int(os.environ.get('PF_EXTRACT_WORKERS', '1'))
+# Default PF ECR table extraction engine, see ECR_EXTRACTION_ENGINES
+app.config['PF_EXTRACT_ENGINE'] = os.environ.get('PF_EXTRACT_ENGINE', 'pdfplumber')
+# Extracted number indexes are cached by PDF content hash, least recently used evicted first
+app.config['INDEX_CACHE_FOLDER'] = os.path.join(BASE_PATH, CACHE_FOLDER, 'number_index')
+app.config['INDEX_CACHE_MAX_BYTES'] = int(os.environ.get('INDEX_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+# Default save profile for site PDFs, see SAVE_PROFILES
+app.config['SAVE_PROFILE'] = os.environ.get('SAVE_PROFILE', 'smallest')
+# Number of jobs whose parsed roster columns are kept in memory
+app.config['ROSTER_STORE_MAX_JOBS'] = int(os.environ.get('ROSTER_STORE_MAX_JOBS', '8'))
+# Persistent job queue: number of jobs run at once, and whether jobs interrupted by a
+# restart are queued again (otherwise they are marked as errors)
+app.config['JOB_DB_PATH'] = os.path.join(BASE_PATH, 'jobs.db')
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', '2'))
+app.config['JOB_RESUME_ON_RESTART'] = os.environ.get('JOB_RESUME_ON_RESTART', '1') == '1'
+# Per-job state is dropped this many seconds after it was last used (never while the
+# job is queued or running); PF mismatch tables beyond the memory budget are spilled to disk
+app.config['JOB_STATE_TTL'] = int(os.environ.get('JOB_STATE_TTL', str(24 * 60 * 60)))
+app.config['JOB_STATE_SPILL_FOLDER'] = os.path.join(BASE_PATH, CACHE_FOLDER, 'job_state')
+app.config['PF_RESULTS_MEMORY_BYTES'] = int(os.environ.get('PF_RESULTS_MEMORY_BYTES', str(256 * 1024 * 1024)))
+# Retention janitor: every RETENTION_INTERVAL seconds (0 = off), upload/output folders of
+# jobs not used for RETENTION_MAX_AGE seconds are deleted, then the oldest ones while the
+# total is over RETENTION_DISK_QUOTA bytes. Queued/running jobs and folders changed in the
+# last RETENTION_GRACE seconds are kept; files are deleted RETENTION_BATCH_SIZE at a time
+app.config['RETENTION_INTERVAL'] = int(os.environ.get('RETENTION_INTERVAL', str(15 * 60)))
+app.config['RETENTION_MAX_AGE'] = int(os.environ.get('RETENTION_MAX_AGE', str(24 * 60 * 60)))
+app.config['RETENTION_DISK_QUOTA'] = int(os.environ.get('RETENTION_DISK_QUOTA', str(10 * 1024 * 1024 * 1024)))
+app.config['RETENTION_GRACE'] = int(os.environ.get('RETENTION_GRACE', str(60 * 60)))
+app.config['RETENTION_BATCH_SIZE'] = int(os.environ.get('RETENTION_BATCH_SIZE', '200'))
+# Bearer token Prometheus sends to scrape /metrics (unset: logged-in users only)
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+
+ACTIVE_JOB_STATES = ('queued', 'processing')
+JOB_STATE_STORES = {}  # Store name -> JobStateStore, reported by /job_state
+
+def _approx_size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+class JobStateStore(MutableMapping):
+    """A dict of per-job state keyed by job_id, with expiry and an optional memory budget.
+
+    Entries expire ttl seconds after they were last read or written, unless
+    protect(job_id) is true. With max_bytes set, the least recently used values
+    are pickled to spill_dir while the total is over budget, and loaded back the
+    next time they are read. Expired entries are swept at most once a minute, on write.
+    """
+    SWEEP_INTERVAL = 60
+    
+    def __init__(self, name, ttl, max_bytes=None, spill_dir=None, protect=None):
+        self.name = name
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.protect = protect
+        self._values = OrderedDict()  # In memory, least recently used first
+        self._sizes = {}
+        self._spilled = {}  # job_id -> (path, bytes)
+        self._touched = {}
+        self._last_sweep = time.monotonic()
+        self._lock = threading.RLock()
+        JOB_STATE_STORES[name] = self
+    
+    def _spill_path(self, key):
+        # Unique per spill, as pool worker processes import this module too
+        return os.path.join(self.spill_dir, self.name, f"{key}-{uuid.uuid4().hex}.pkl")
+    
+    def _expired(self, key, now):
+        return (
+            now - self._touched.get(key, now) > self.ttl and
+            not (self.protect and self.protect(key))
+        )
+    
+    def _drop(self, key):
+        self._values.pop(key, None)
+        self._sizes.pop(key, None)
+        self._touched.pop(key, None)
+        spilled = self._spilled.pop(key, None)
+        if spilled:
+            try:
+                os.remove(spilled[0])
+            except FileNotFoundError:
+                pass
+    
+    def _enforce_budget(self, keep=None):
+        # keep is a key just read back from disk: only other values are spilled, so a
+        # value over the budget on its own stays in memory until the next write
+        if self.max_bytes is None:
+            return
+        total = sum(self._sizes.values())
+        for key in list(self._values):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            value = self._values.pop(key)
+            size = self._sizes.pop(key)
+            path = self._spill_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            self._spilled[key] = (path, size)
+            total -= size
+    
+    def __getitem__(self, key):
+        with self._lock:
+            now = time.monotonic()
+            if key in self._touched and self._expired(key, now):
+                self._drop(key)
+            if key in self._spilled:
+                path, size = self._spilled.pop(key)
+                with open(path, 'rb') as f:
+                    self._values[key] = pickle.load(f)
+                self._sizes[key] = size
+                os.remove(path)
+            value = self._values[key]
+            self._values.move_to_end(key)
+            self._touched[key] = now
+            self._enforce_budget(keep=key)
+            return value
+    
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._drop(key)
+            self._values[key] = value
+            self._touched[key] = time.monotonic()
+            if self.max_bytes is not None:
+                self._sizes[key] = _approx_size(value)
+                self._enforce_budget()
+            if time.monotonic() - self._last_sweep > self.SWEEP_INTERVAL:
+                self.sweep()
+    
+    def __delitem__(self, key):
+        with self._lock:
+            if key not in self._values and key not in self._spilled:
+                raise KeyError(key)
+            self._drop(key)
+    
+    def __contains__(self, key):
+        # Membership does not count as use, and does not load a spilled value
+        with self._lock:
+            return key in self._touched and not self._expired(key, time.monotonic())
+    
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._touched))
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._touched)
+    
+    def discard(self, key):
+        # Remove an entry if present, without loading a spilled value
+        with self._lock:
+            self._drop(key)
+    
+    def peek(self, key, default=None):
+        # Read an in-memory value without marking it as used
+        with self._lock:
+            return self._values.get(key, default)
+    
+    def sweep(self):
+        """Drop expired entries; returns how many were dropped."""
+        with self._lock:
+            now = time.monotonic()
+            self._last_sweep = now
+            expired = [key for key in self._touched if self._expired(key, now)]
+            for key in expired:
+                self._drop(key)
+            if self.spill_dir:
+                self._remove_stale_spill_files()
+            return len(expired)
+    
+    def _remove_stale_spill_files(self):
+        # Files not written for ttl seconds belong to expired entries, or to a previous run
+        folder = os.path.join(self.spill_dir, self.name)
+        if not os.path.isdir(folder):
+            return
+        cutoff = time.time() - self.ttl
+        for entry in os.scandir(folder):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._touched),
+                'bytes': sum(_approx_size(value) for value in self._values.values()),
+                'spilled_entries': len(self._spilled),
+                'spilled_bytes': sum(size for _, size in self._spilled.values())
+            }
+
+def _job_is_active(job_id):
+    return job_status.peek(job_id) in ACTIVE_JOB_STATES
+
+def _job_state_store(name, **kwargs):
+    return JobStateStore(name, app.config['JOB_STATE_TTL'], protect=_job_is_active, **kwargs)
+
+def sweep_job_state():
+    return sum(store.sweep() for store in JOB_STATE_STORES.values())
 
 # Global variables to track job progress and PF mismatch data
-job_progress = {}
-job_status = {}
-pf_mismatched_data = {}  # Store DataFrame per job_id
-pf_output_files = {}  # Store output Excel filename per job_id
+job_progress = _job_state_store('job_progress')
+job_status = _job_state_store('job_status')
+job_stats = _job_state_store('job_stats')  # Store per-job timing/statistics per job_id
+pf_mismatched_data = _job_state_store(  # Store DataFrame per job_id
+    'pf_mismatched_data',
+    max_bytes=app.config['PF_RESULTS_MEMORY_BYTES'],
+    spill_dir=app.config['JOB_STATE_SPILL_FOLDER']
+)
+pf_output_files = _job_state_store('pf_output_files')  # Store output Excel filename per job_id
+pdf_hashes = _job_state_store('pdf_hashes')  # Store SHA-256 of the uploaded PDF per job_id
+index_cache_stats = {'hits': 0, 'misses': 0}
+index_cache_lock = threading.Lock()
+roster_store = OrderedDict()  # Store roster header and parsed columns per job_id, least recently used first
+roster_store_lock = threading.Lock()
+job_events = _job_state_store('job_events')  # Store progress/site_result/status events per job_id, streamed by /progress_stream
+job_events_condition = threading.Condition()
+job_manifests = _job_state_store('job_manifests')  # Store the finished site outputs of the current run per job_id
+job_pages = _job_state_store('job_pages')  # Store pages processed/total per job_id for page-based jobs
+job_cancel_requests = set()  # job_ids whose running job should stop at the next page
+job_spans = _job_state_store('job_spans')  # Store timed pipeline stages per job_id
+
+# --- Metrics ---
+# Counters and histograms kept in this process and served by /metrics in the
+# Prometheus text format. Metric name -> (type, help, histogram buckets)
+METRICS = {
+    'fortune_jobs_total': ('counter', 'Jobs finished, by kind and final status', None),
+    'fortune_job_duration_seconds': (
+        'histogram', 'Time from a job starting to finishing, by kind',
+        (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+    ),
+    'fortune_stage_duration_seconds': (
+        'histogram', 'Time spent in each pipeline stage, by stage',
+        (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+    ),
+    'fortune_job_pages_per_second': (
+        'histogram', 'PDF pages processed per second of job time, by kind',
+        (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+    ),
+    'fortune_pages_processed_total': ('counter', 'PDF pages processed by finished jobs, by kind', None),
+    'fortune_bytes_written_total': ('counter', 'Bytes of output files written by finished jobs, by kind', None),
+    'fortune_queue_depth': ('gauge', 'Jobs in the queue, by status', None)
+}
+metric_values = {}  # Metric name -> {label tuple: value, or histogram [bucket counts, sum, count]}
+metrics_lock = threading.Lock()
+
+def _metric_labels(labels):
+    return tuple(sorted(labels.items()))
+
+def inc_counter(name, value=1, **labels):
+    with metrics_lock:
+        values = metric_values.setdefault(name, {})
+        key = _metric_labels(labels)
+        values[key] = values.get(key, 0) + value
+
+def observe(name, value, **labels):
+    buckets = METRICS[name][2]
+    with metrics_lock:
+        values = metric_values.setdefault(name, {})
+        state = values.setdefault(_metric_labels(labels), [[0] * len(buckets), 0.0, 0])
+        for idx, bound in enumerate(buckets):
+            if value <= bound:
+                state[0][idx] += 1
+        state[1] += value
+        state[2] += 1
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape_label_value(value)}"' for key, value in labels) + '}'
+
+def render_metrics(gauges):
+    """Return every metric in the Prometheus text format; gauges maps name -> {label tuple: value}."""
+    with metrics_lock:
+        snapshot = {name: {key: (list(value[0]), value[1], value[2]) if isinstance(value, list) else value
+                           for key, value in values.items()}
+                    for name, values in metric_values.items()}
+    snapshot.update(gauges)
+    lines = []
+    for name, (metric_type, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in sorted(snapshot.get(name, {}).items()):
+            if metric_type != 'histogram':
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            bucket_counts, total, count = value
+            for bound, bucket_count in zip(buckets, bucket_counts):
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {round(total, 6)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return '\n'.join(lines) + '\n'
+
+# --- Job spans ---
+# Each job records how long it spent in every pipeline stage: upload_save,
+# excel_parse, filter, pdf_open, index, annotate and save for highlight jobs;
+# upload_save, extract, compare and excel_write for PF mismatch jobs.
+def record_span(job_id, stage, seconds, **attrs):
+    span = dict(attrs, stage=stage, seconds=round(seconds, 4), ended_at=datetime.now().isoformat())
+    with metrics_lock:
+        spans = job_spans.get(job_id)
+        if spans is None:
+            spans = job_spans[job_id] = []
+        spans.append(span)
+    observe('fortune_stage_duration_seconds', seconds, stage=stage)
+
+@contextmanager
+def job_span(job_id, stage, **attrs):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(job_id, stage, time.perf_counter() - start, **attrs)
+
+def record_site_spans(job_id, result):
+    # A site PDF's annotation and save times, measured by process_pdf_for_site
+    if result:
+        record_span(job_id, 'annotate', result.get('annotate_seconds', 0), site=result['site'])
+        record_span(job_id, 'save', result['save_seconds'], site=result['site'])
+
+def summarize_spans(spans):
+    """Total seconds and span count per stage, in order of first appearance."""
+    summary = {}
+    for span in spans or []:
+        stage = summary.setdefault(span['stage'], {'count': 0, 'seconds': 0.0})
+        stage['count'] += 1
+        stage['seconds'] = round(stage['seconds'] + span['seconds'], 4)
+    return summary
 
 # Simple user database (replace with proper database in production)
 USERS = {
@@ -64,6 +417,25 @@ USERS = {
 def allowed_file(filename, extensions):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in extensions
 
+def save_upload_with_hash(file_storage, path, chunk_size=1024 * 1024):
+    # Write the upload to disk and hash it in the same pass
+    sha256 = hashlib.sha256()
+    with open(path, 'wb') as f:
+        while True:
+            chunk = file_storage.stream.read(chunk_size)
+            if not chunk:
+                break
+            sha256.update(chunk)
+            f.write(chunk)
+    return sha256.hexdigest()
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
 # Set up logging
 def setup_logging(log_dir=os.path.join(BASE_PATH, LOG_FOLDER)):
     os.makedirs(log_dir, exist_ok=True)
@@ -109,6 +481,654 @@ def get_middle_two_chars(s):
     mid = length // 2
     return s[mid-1:mid+1]
 
+PF_COLUMNS = ["Sl. No", "UAN", "ECR", "UAN Repository"]
+
+class JobCancelled(Exception):
+    pass
+
+def _pdfplumber_page_table(pdf, page_num):
+    page = pdf.pages[page_num]
+    table = page.extract_table()
+    page.close()  # Drop the page's parsed objects once its table is read
+    return table
+
+RULING_TOLERANCE = 3  # Points; as pdfplumber's snap/join tolerances
+
+def _merge_segments(segments, tolerance=RULING_TOLERANCE):
+    # segments: (position, start, end). Positions within tolerance of a cluster's first
+    # position are snapped to it, then overlapping or touching pieces are joined.
+    snapped = []
+    cluster_position = None
+    for position, start, end in sorted(segments):
+        if cluster_position is None or position - cluster_position > tolerance:
+            cluster_position = position
+        snapped.append((cluster_position, start, end))
+    merged = []
+    for position, start, end in sorted(snapped):
+        if merged and merged[-1][0] == position and start <= merged[-1][2] + tolerance:
+            merged[-1][2] = max(merged[-1][2], end)
+        else:
+            merged.append([position, start, end])
+    return [tuple(segment) for segment in merged]
+
+def _ruling_segments(page):
+    """Horizontal (y, x0, x1) and vertical (x, y0, y1) ruling segments drawn on the page."""
+    horizontal, vertical = [], []
+    
+    def add_rect(rect):
+        if rect.height <= 2:
+            horizontal.append(((rect.y0 + rect.y1) / 2, rect.x0, rect.x1))
+        elif rect.width <= 2:
+            vertical.append(((rect.x0 + rect.x1) / 2, rect.y0, rect.y1))
+        else:
+            horizontal.extend([(rect.y0, rect.x0, rect.x1), (rect.y1, rect.x0, rect.x1)])
+            vertical.extend([(rect.x0, rect.y0, rect.y1), (rect.x1, rect.y0, rect.y1)])
+    
+    for path in page.get_drawings():
+        for item in path['items']:
+            if item[0] == 'l':
+                p1, p2 = item[1], item[2]
+                if abs(p1.y - p2.y) <= 1:
+                    horizontal.append(((p1.y + p2.y) / 2, min(p1.x, p2.x), max(p1.x, p2.x)))
+                elif abs(p1.x - p2.x) <= 1:
+                    vertical.append(((p1.x + p2.x) / 2, min(p1.y, p2.y), max(p1.y, p2.y)))
+            elif item[0] == 're':
+                add_rect(item[1])
+            elif item[0] == 'qu' and item[1].is_rectangular:
+                add_rect(item[1].rect)
+    return _merge_segments(horizontal), _merge_segments(vertical)
+
+def _largest_grid(horizontal, vertical, tolerance=RULING_TOLERANCE):
+    # Group the segments into connected grids and return the one with the most cells
+    # (the topmost on a tie), as (horizontal, vertical) segment lists
+    segments = [('h', seg) for seg in horizontal] + [('v', seg) for seg in vertical]
+    parent = list(range(len(segments)))
+    
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    
+    for i, (_, (y, x0, x1)) in enumerate(segments[:len(horizontal)]):
+        for j in range(len(horizontal), len(segments)):
+            x, y0, y1 = segments[j][1]
+            if x0 - tolerance <= x <= x1 + tolerance and y0 - tolerance <= y <= y1 + tolerance:
+                parent[find(i)] = find(j)
+    
+    grids = {}
+    for i, (kind, seg) in enumerate(segments):
+        grids.setdefault(find(i), ([], []))[0 if kind == 'h' else 1].append(seg)
+    best = None
+    for grid_h, grid_v in grids.values():
+        cells = (len({seg[0] for seg in grid_h}) - 1) * (len({seg[0] for seg in grid_v}) - 1)
+        if cells <= 0:
+            continue
+        top = min(seg[0] for seg in grid_h)
+        if best is None or cells > best[0] or (cells == best[0] and top < best[1]):
+            best = (cells, top, grid_h, grid_v)
+    return (best[2], best[3]) if best else None
+
+def _covers(segments, position, point, tolerance=RULING_TOLERANCE):
+    return any(abs(seg[0] - position) <= tolerance and seg[1] - tolerance <= point <= seg[2] + tolerance for seg in segments)
+
+def _pymupdf_page_table(doc, page_num):
+    """The largest ruled table on the page, read by bucketing words into its cells.
+
+    Cells follow pdfplumber's extract_table: text lines joined with newlines, and
+    a cell merged across a missing ruling line holds its text in its first row and
+    column, with None in the positions it covers.
+    """
+    page = doc[page_num]
+    grid = _largest_grid(*_ruling_segments(page))
+    if grid is None:
+        return None
+    grid_h, grid_v = grid
+    ys = sorted({seg[0] for seg in grid_h})
+    xs = sorted({seg[0] for seg in grid_v})
+    n_rows, n_cols = len(ys) - 1, len(xs) - 1
+    
+    # Unit cells are merged where the ruling line between them is not drawn
+    anchor = {}
+    for r in range(n_rows):
+        mid_y = (ys[r] + ys[r + 1]) / 2
+        for c in range(n_cols):
+            mid_x = (xs[c] + xs[c + 1]) / 2
+            if c > 0 and not _covers(grid_v, xs[c], mid_y):
+                anchor[(r, c)] = anchor[(r, c - 1)]
+            elif r > 0 and not _covers(grid_h, ys[r], mid_x):
+                anchor[(r, c)] = anchor[(r - 1, c)]
+            else:
+                anchor[(r, c)] = (r, c)
+    
+    cell_words = {}
+    for x0, y0, x1, y1, word, *_ in page.get_text('words', sort=True):
+        mid_x, mid_y = (x0 + x1) / 2, (y0 + y1) / 2
+        c = bisect.bisect_right(xs, mid_x) - 1
+        r = bisect.bisect_right(ys, mid_y) - 1
+        if 0 <= r < n_rows and 0 <= c < n_cols:
+            cell_words.setdefault(anchor[(r, c)], []).append((y0, y1, x0, word))
+    
+    rows = []
+    for r in range(n_rows):
+        row = []
+        for c in range(n_cols):
+            if anchor[(r, c)] != (r, c):
+                row.append(None)
+                continue
+            lines = []
+            for y0, y1, x0, word in sorted(cell_words.get((r, c), ())):
+                if lines and y0 - lines[-1][0] <= RULING_TOLERANCE:
+                    lines[-1][1].append((x0, word))
+                else:
+                    lines.append((y0, [(x0, word)]))
+            row.append('\n'.join(' '.join(word for _, word in sorted(words)) for _, words in lines))
+        rows.append(row)
+    return rows
+
+# PF ECR table extraction engines: how to open the PDF, count its pages, and read
+# the main table of one page as a list of rows (header row first)
+ECR_EXTRACTION_ENGINES = {
+    'pdfplumber': {'open': pdfplumber.open, 'page_count': lambda pdf: len(pdf.pages), 'page_table': _pdfplumber_page_table},
+    'pymupdf': {'open': fitz.open, 'page_count': len, 'page_table': _pymupdf_page_table}
+}
+
+def _ecr_table_rows(table):
+    rows = []
+    if table:
+        for row in table[1:]:  # Skip header row
+            rows.append([row[0], row[1], row[2], row[3]])
+    return rows
+
+def _extract_ecr_shard(pdf_path, first_page, last_page, engine='pdfplumber'):
+    # Runs in a pool worker: rows of pages first_page..last_page (inclusive), in page order
+    extractor = ECR_EXTRACTION_ENGINES[engine]
+    data = []
+    with extractor['open'](pdf_path) as pdf:
+        for page_num in range(first_page, last_page + 1):
+            data.extend(_ecr_table_rows(extractor['page_table'](pdf, page_num)))
+    return data
+
+def extract_ecr_rows(pdf_path, on_page=None, workers=1, engine='pdfplumber'):
+    """Read the first four table columns from every ECR page except the first and last.
+
+    engine names one of ECR_EXTRACTION_ENGINES. With workers > 1 the pages are
+    split into contiguous shards read by a process pool, and the shards are
+    joined back in page order, so the rows are the same as a serial read.
+    on_page(done, total) is called as pages (or shards) finish; it may raise
+    JobCancelled to stop.
+    """
+    extractor = ECR_EXTRACTION_ENGINES[engine]
+    with extractor['open'](pdf_path) as pdf:
+        page_count = extractor['page_count'](pdf)
+        if workers <= 1:
+            data = []
+            total = max(0, page_count - 2)
+            for done, page_num in enumerate(range(1, page_count - 1), start=1):  # Skip first and last page
+                data.extend(_ecr_table_rows(extractor['page_table'](pdf, page_num)))
+                if on_page:
+                    on_page(done, total)
+            return data
+    
+    total = max(0, page_count - 2)
+    # A few shards per worker keeps workers busy when pages differ in cost, and
+    # gives progress updates more often than once per worker
+    shard_size = max(1, -(-total // (workers * 4)))
+    shards = [(first, min(first + shard_size, total + 1) - 1) for first in range(1, total + 1, shard_size)]
+    shard_rows = [None] * len(shards)
+    
+    context = multiprocessing.get_context('spawn')
+    pool = ProcessPoolExecutor(max_workers=min(workers, len(shards) or 1), mp_context=context)
+    try:
+        futures = {pool.submit(_extract_ecr_shard, pdf_path, first, last, engine): i for i, (first, last) in enumerate(shards)}
+        done = 0
+        for future in as_completed(futures):
+            i = futures[future]
+            shard_rows[i] = future.result()
+            done += shards[i][1] - shards[i][0] + 1
+            if on_page:
+                on_page(done, total)
+    finally:
+        # On cancel or error, drop the shards not started yet and return without
+        # waiting for the ones in progress; their workers exit when they finish
+        pool.shutdown(wait=False, cancel_futures=True)
+    return [row for rows in shard_rows for row in rows]
+
+def clean_names(names, lower=False):
+    """Vectorised clean_name (lower=True) or clean_name_display over a Series.
+
+    Non-string values become "". Collapsing whitespace runs with \\s+ and stripping
+    matches ' '.join(name.split()), as both use str.isspace's definition.
+    """
+    text = names.where(names.map(lambda value: isinstance(value, str)), '').astype(object)
+    # Names repeat across rows, so each distinct value is cleaned once
+    codes, uniques = pd.factorize(text)
+    cleaned = pd.Series(uniques, dtype=object).str.replace(r'\s+', ' ', regex=True).str.strip()
+    if lower:
+        cleaned = cleaned.str.lower()
+    return pd.Series(cleaned.to_numpy(dtype=object)[codes], index=names.index)
+
+def middle_two_chars(names):
+    # Vectorised get_middle_two_chars: strings of the same length share one slice
+    names = names.str.strip()
+    lengths = names.str.len().to_numpy()
+    middle = names.to_numpy(dtype=object, copy=True)  # Strings shorter than two characters are kept whole
+    for length in np.unique(lengths[lengths >= 2]):
+        rows = np.flatnonzero(lengths == length)
+        mid = int(length) // 2
+        middle[rows] = names.iloc[rows].str[mid - 1:mid + 1].to_numpy(dtype=object)
+    return pd.Series(middle, index=names.index)
+
+def names_match(ecr_names, repository_names):
+    """Vectorised PF name rule: the cleaned names agree on their first four, last
+    four and middle two characters. Returns a boolean Series on ecr_names' index.
+    """
+    # Identical cells always match, so the rule only runs where the raw values differ
+    match = pd.Series(
+        ecr_names.to_numpy(dtype=object) == repository_names.to_numpy(dtype=object),
+        index=ecr_names.index,
+        dtype=bool
+    )
+    differ = ~match
+    if differ.any():
+        ecr = clean_names(ecr_names[differ], lower=True)
+        repository = clean_names(repository_names[differ], lower=True)
+        match[differ] = (
+            (ecr.str[:4] == repository.str[:4]) &
+            (ecr.str[-4:] == repository.str[-4:]) &
+            (middle_two_chars(ecr) == middle_two_chars(repository))
+        )
+    return match
+
+def find_name_mismatches(data):
+    # Rows whose ECR name and UAN Repository name differ, with names cleaned for display
+    df = pd.DataFrame(data, columns=PF_COLUMNS)
+    df = df[df['Sl. No'].notna() & (df['Sl. No'] != 'None')].reset_index(drop=True)
+    df = df[~names_match(df['ECR'], df['UAN Repository'])].copy()
+    
+    # Display form: whitespace collapsed as clean_name_display does, then spaces removed
+    for column in ('ECR', 'UAN Repository'):
+        df[column] = clean_names(df[column]).str.replace(' ', '', regex=False)
+    return df
+
+# Mismatch results are served a page at a time; limit is capped at PF_RESULTS_MAX_PAGE_SIZE
+PF_RESULTS_PAGE_SIZE = 100
+PF_RESULTS_MAX_PAGE_SIZE = 1000
+PF_NUMERIC_COLUMNS = ('Sl. No', 'UAN')
+
+def query_mismatches(df, offset=0, limit=PF_RESULTS_PAGE_SIZE, sort=None, order='asc', uan=None, name=None):
+    """Filter, sort and slice a mismatch table.
+
+    uan matches a substring of the UAN; name matches a substring of either name,
+    ignoring case and spaces (the stored names have their spaces removed).
+    Sl. No and UAN sort numerically, names alphabetically. Returns the number of
+    rows after filtering and the requested page.
+    """
+    if uan:
+        df = df[df['UAN'].fillna('').astype(str).str.contains(uan.strip(), regex=False)]
+    if name:
+        needle = ''.join(name.split()).lower()
+        df = df[
+            df['ECR'].fillna('').astype(str).str.lower().str.contains(needle, regex=False) |
+            df['UAN Repository'].fillna('').astype(str).str.lower().str.contains(needle, regex=False)
+        ]
+    if sort:
+        if sort in PF_NUMERIC_COLUMNS:
+            key = lambda column: pd.to_numeric(column, errors='coerce')
+        else:
+            key = lambda column: column.fillna('').astype(str).str.lower()
+        df = df.sort_values(sort, ascending=(order != 'desc'), kind='stable', key=key, na_position='last')
+    return len(df), df.iloc[offset:offset + limit]
+
+# Number index helpers
+DIGITS = set('0123456789')
+
+def build_number_index(pdf_path, lengths=(10, 12), source_doc=None):
+    """Scan the PDF once and map every digit string of the given lengths to its hits.
+
+    Returns a dict with 'page_count' and 'numbers', where 'numbers' maps a digit
+    string to a list of (page_num, (x0, y0, x1, y1)) tuples. Digits are joined
+    across adjacent spans of the same line, so numbers split over several spans are
+    still found. Like page.search_for, a number split over spans yields one rect
+    per span and digit strings embedded in longer runs are matched too.
+
+    Pass an already open source_doc to reuse a job's document session.
+    """
+    numbers = {}
+    doc = fitz.open(pdf_path) if source_doc is None else source_doc
+    try:
+        page_count = len(doc)
+        for page_num, page in enumerate(doc):
+            for run in _page_digit_runs(page):
+                for length in lengths:
+                    for start in range(len(run) - length + 1):
+                        chars = run[start:start + length]
+                        number = ''.join(c for c, _, _ in chars)
+                        hits = numbers.setdefault(number, [])
+                        for rect in _span_rects(chars):
+                            hits.append((page_num, rect))
+    finally:
+        if source_doc is None:
+            doc.close()
+    return {'page_count': page_count, 'numbers': numbers}
+
+def _page_digit_runs(page):
+    # Each run is a list of (char, span_no, bbox) for consecutive digits in one line
+    runs = []
+    text = page.get_text("rawdict")
+    for block in text["blocks"]:
+        for line in block.get("lines", []):
+            run = []
+            for span_no, span in enumerate(line["spans"]):
+                for char in span["chars"]:
+                    if char["c"] in DIGITS:
+                        run.append((char["c"], span_no, char["bbox"]))
+                    elif run:
+                        runs.append(run)
+                        run = []
+            if run:
+                runs.append(run)
+    return runs
+
+def _span_rects(chars):
+    # Union the character boxes of each span, mirroring the rects page.search_for returns
+    rects = []
+    current_span = None
+    for _, span_no, (x0, y0, x1, y1) in chars:
+        if span_no != current_span:
+            rects.append([x0, y0, x1, y1])
+            current_span = span_no
+        else:
+            rect = rects[-1]
+            rect[0], rect[1] = min(rect[0], x0), min(rect[1], y0)
+            rect[2], rect[3] = max(rect[2], x1), max(rect[3], y1)
+    return [tuple(rect) for rect in rects]
+
+# Job events, pushed to the browser by /progress_stream
+def publish_job_event(job_id, event, data):
+    with job_events_condition:
+        job_events.setdefault(job_id, []).append((event, data))
+        job_events_condition.notify_all()
+
+def report_site_done(job_id, output_dir, done, total, result):
+    # Called as each site output is written (or skipped), in serial and pool mode.
+    # Raises JobCancelled once the job has been asked to stop, so it ends between sites
+    job_progress[job_id] = int((done / total) * 100)
+    if result:
+        record_site_spans(job_id, result)
+        add_to_job_manifest(job_id, output_dir, result)
+        publish_job_event(job_id, 'site_result', result)
+    publish_job_event(job_id, 'progress', {'progress': job_progress[job_id], 'status': 'processing'})
+    if job_id in job_cancel_requests:
+        raise JobCancelled()
+
+# Job manifest: the site outputs finished so far, kept in memory and mirrored to
+# manifest.json in the job's output folder so /results can list them mid-run
+MANIFEST_FILENAME = 'manifest.json'
+
+def write_job_manifest(output_dir, sites):
+    manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+    tmp_path = f"{manifest_path}.part"
+    with open(tmp_path, 'w') as f:
+        json.dump({'updated_at': datetime.now().isoformat(), 'sites': sites}, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def read_job_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILENAME)) as f:
+            return json.load(f)['sites']
+    except FileNotFoundError:
+        return None
+
+def start_job_manifest(job_id, output_dir):
+    job_manifests[job_id] = []
+    write_job_manifest(output_dir, [])
+
+def add_to_job_manifest(job_id, output_dir, result):
+    sites = job_manifests.setdefault(job_id, [])
+    # Batch jobs also record the source PDF of each output
+    sites.append({key: result[key] for key in ('pdf', 'site', 'file', 'matches', 'pages', 'bytes') if key in result})
+    write_job_manifest(output_dir, sites)
+
+# Roster helpers
+def read_excel_columns(excel_path):
+    # Header-only pass: with nrows=0 the read-only workbook is not read past the header row
+    return pd.read_excel(excel_path, nrows=0).columns.tolist()
+
+def _roster_entry(job_id, excel_path):
+    # Caller must hold roster_store_lock
+    entry = roster_store.get(job_id)
+    if entry is None or entry['path'] != excel_path:
+        entry = {'path': excel_path, 'header': None, 'columns': {}}
+        roster_store[job_id] = entry
+    roster_store.move_to_end(job_id)
+    while len(roster_store) > app.config['ROSTER_STORE_MAX_JOBS']:
+        roster_store.popitem(last=False)
+    return entry
+
+def get_roster_header(job_id, excel_path):
+    with roster_store_lock:
+        entry = _roster_entry(job_id, excel_path)
+        if entry['header'] is not None:
+            return list(entry['header'])
+    header = read_excel_columns(excel_path)
+    with roster_store_lock:
+        _roster_entry(job_id, excel_path)['header'] = header
+    return list(header)
+
+def load_roster_columns(job_id, excel_path, columns):
+    """Return a DataFrame holding only `columns` of the roster.
+
+    Each column is parsed from the workbook at most once per job and kept in
+    roster_store, so re-running a job with other options does not re-read it.
+    """
+    columns = list(dict.fromkeys(columns))
+    with roster_store_lock:
+        cached = dict(_roster_entry(job_id, excel_path)['columns'])
+    missing = [col for col in columns if col not in cached]
+    if missing:
+        parsed = pd.read_excel(excel_path, usecols=missing)
+        with roster_store_lock:
+            entry = _roster_entry(job_id, excel_path)
+            for col in missing:
+                entry['columns'][col] = parsed[col]
+                cached[col] = parsed[col]
+    return pd.DataFrame({col: cached[col] for col in columns}, copy=True)
+
+def group_numbers_by_site(df, site_column, target_column):
+    """Group the cleaned target numbers by site in a single pass.
+
+    Returns a list of (site, numbers) in order of first appearance, where numbers
+    is an array of the site's distinct numbers, also in order of first appearance.
+    Rows without a site or number are skipped.
+    """
+    numbers = df[target_column].astype(str).str.strip().str.replace(" ", "", regex=False)
+    keep = df[site_column].notna().to_numpy() & ~numbers.isin(["", "nan"]).to_numpy()
+    codes, sites = pd.factorize(df[site_column][keep], sort=False)
+    pairs = pd.DataFrame({'code': codes, 'number': numbers[keep].to_numpy()}).drop_duplicates()
+    
+    # A stable sort by site code keeps each site's numbers in their original order
+    order = np.argsort(pairs['code'].to_numpy(), kind='stable')
+    sorted_codes = pairs['code'].to_numpy()[order]
+    sorted_numbers = pairs['number'].to_numpy()[order]
+    boundaries = np.searchsorted(sorted_codes, np.arange(1, len(sites)))
+    return list(zip(sites, np.split(sorted_numbers, boundaries)))
+
+# Number index cache, keyed by the SHA-256 of the PDF content
+INDEX_CACHE_VERSION = 1
+
+def _index_cache_path(pdf_hash):
+    return os.path.join(app.config['INDEX_CACHE_FOLDER'], f"{pdf_hash}_v{INDEX_CACHE_VERSION}.pkl")
+
+def load_number_index(pdf_path, pdf_hash=None, source_doc=None, logger=None):
+    """Return the (10, 12)-digit number index for a PDF, from the cache when possible."""
+    if logger is None:
+        logger = logging.getLogger()
+    if pdf_hash is None:
+        pdf_hash = file_sha256(pdf_path)
+    cache_path = _index_cache_path(pdf_hash)
+    
+    try:
+        with open(cache_path, 'rb') as f:
+            number_index = pickle.load(f)
+        os.utime(cache_path)  # Mark as recently used
+        with index_cache_lock:
+            index_cache_stats['hits'] += 1
+            stats = dict(index_cache_stats)
+        logger.info(f"Number index cache hit for {pdf_hash[:12]} (hits={stats['hits']}, misses={stats['misses']})")
+        return number_index, True
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"Discarding unreadable number index cache entry {cache_path}: {e}")
+    
+    with index_cache_lock:
+        index_cache_stats['misses'] += 1
+        stats = dict(index_cache_stats)
+    logger.info(f"Number index cache miss for {pdf_hash[:12]} (hits={stats['hits']}, misses={stats['misses']})")
+    
+    number_index = build_number_index(pdf_path, lengths=(10, 12), source_doc=source_doc)
+    try:
+        os.makedirs(app.config['INDEX_CACHE_FOLDER'], exist_ok=True)
+        tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(number_index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+        evict_index_cache(logger=logger)
+    except Exception as e:
+        logger.error(f"Could not write number index cache entry {cache_path}: {e}")
+    return number_index, False
+
+def evict_index_cache(max_bytes=None, logger=None):
+    # Drop least recently used entries until the cache fits within max_bytes
+    if logger is None:
+        logger = logging.getLogger()
+    if max_bytes is None:
+        max_bytes = app.config['INDEX_CACHE_MAX_BYTES']
+    cache_folder = app.config['INDEX_CACHE_FOLDER']
+    with index_cache_lock:
+        entries = []
+        for name in os.listdir(cache_folder):
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(cache_folder, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                total_bytes -= size
+                logger.info(f"Evicted number index cache entry: {path}")
+            except FileNotFoundError:
+                pass
+
+# Highlight type -> length of the roster numbers it matches
+HIGHLIGHT_TYPES = {'uan': 12, 'esic': 10}
+
+# Highlight color name -> RGBA border color
+HIGHLIGHT_COLORS = {
+    'red': (1, 0, 0, 1),
+    'blue': (0, 0, 1, 1),
+    'green': (0, 0.5, 0, 1),
+    'black': (0, 0, 0, 1),
+    'orange': (1, 0.5, 0, 1),
+    'yellow': (1, 0.9, 0, 1)
+}
+
+def parse_color(color_str):
+    return HIGHLIGHT_COLORS.get(color_str.lower(), HIGHLIGHT_COLORS['red'])
+
+def make_render_options(
+    expand_left=1,
+    expand_right=1,
+    expand_top=1,
+    expand_bottom=1,
+    border_color=(1, 0, 0, 1),
+    special_color=(0, 0, 1, 1),
+    border_width=0.5,
+    highlight_mode="border",
+    highlight_opacity=0.25,
+    flatten=False,
+    save_profile='smallest'
+):
+    # The process_pdf_for_site options shared by every site of a job
+    return {
+        'expand_left': expand_left,
+        'expand_right': expand_right,
+        'expand_top': expand_top,
+        'expand_bottom': expand_bottom,
+        'border_color': border_color,
+        'special_color': special_color,
+        'border_width': border_width,
+        'highlight_mode': highlight_mode,
+        'highlight_opacity': highlight_opacity,
+        'flatten': flatten,
+        'save_profile': save_profile
+    }
+
+def site_output_filename(group, prefix=''):
+    safe_site_name = ''.join(c if c.isalnum() else '_' for c in str(group['site_name']))
+    return f"{prefix}{safe_site_name}_{group['highlight_type']}.pdf"
+
+def group_roster_by_site(job_id, excel_path, highlight_type, uan_column, esic_column, site_column, logger):
+    """Return the roster's valid numbers grouped per site and highlight type.
+
+    Each group is a dict with site_name, highlight_type and number_dict. Returns
+    None (after logging why) if a column is missing or no valid numbers remain.
+    """
+    # 'both' renders the UAN and the ESIC set of every site from a single index pass
+    highlight_types = list(HIGHLIGHT_TYPES) if highlight_type == 'both' else [highlight_type]
+    target_columns = {'uan': uan_column, 'esic': esic_column}
+    required_columns = [target_columns[item_type] for item_type in highlight_types] + [site_column]
+    header = get_roster_header(job_id, excel_path)
+    
+    for col in required_columns:
+        if col not in header:
+            logger.error(f"Required column not found: {col}")
+            return None
+    
+    with job_span(job_id, 'excel_parse'):
+        roster = load_roster_columns(job_id, excel_path, required_columns)
+    
+    filter_start = time.perf_counter()
+    site_groups = []
+    for item_type in highlight_types:
+        target_column = target_columns[item_type]
+        df = roster.copy()
+        df[target_column] = df[target_column].astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
+        
+        expected_length = HIGHLIGHT_TYPES[item_type]
+        df = df[
+            (df[target_column].notna()) &
+            (df[target_column] != '0') &
+            (df[target_column] != 'nan') &
+            (df[target_column].str.match(r'^\d+$')) &
+            (df[target_column].str.len() == expected_length)
+        ]
+        
+        if df.empty:
+            logger.warning(f"No valid {item_type.upper()} numbers in column: {target_column}")
+            continue
+        
+        for site, numbers in group_numbers_by_site(df, site_column, target_column):
+            site_groups.append({
+                'site_name': site,
+                'highlight_type': item_type,
+                'number_dict': dict.fromkeys(numbers.tolist(), "regular")
+            })
+    record_span(job_id, 'filter', time.perf_counter() - filter_start)
+    
+    if not site_groups:
+        logger.error("No valid data after filtering the target column")
+        return None
+    return site_groups
+
 def highlight_uans_by_site(
     job_id,
     excel_path,
@@ -127,7 +1147,12 @@ def highlight_uans_by_site(
     border_width=0.5,
     highlight_mode="border",
     highlight_opacity=0.25,
-    logger=None
+    logger=None,
+    workers=1,
+    pdf_hash=None,
+    flatten=False,
+    save_profile='smallest',
+    lazy=False
 ):
     global job_progress, job_status
     if logger is None:
@@ -136,81 +1161,610 @@ def highlight_uans_by_site(
     os.makedirs(output_dir, exist_ok=True)
     
     try:
-        df = pd.read_excel(excel_path)
-        target_column = uan_column if highlight_type == 'uan' else esic_column
-        required_columns = [target_column, site_column]
-        
-        for col in required_columns:
-            if col not in df.columns:
-                logger.error(f"Required column not found: {col}")
-                job_status[job_id] = 'error'
-                return False
-        
-        df[target_column] = df[target_column].astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
-        
-        expected_length = 12 if highlight_type == 'uan' else 10
-        df = df[
-            (df[target_column].notna()) &
-            (df[target_column] != '0') &
-            (df[target_column] != 'nan') &
-            (df[target_column].str.match(r'^\d+$')) &
-            (df[target_column].str.len() == expected_length)
-        ]
-        
-        if df.empty:
-            logger.error("No valid data after filtering the target column")
+        # A re-run replaces any earlier lazy plan; a lazy re-run must also drop site
+        # PDFs rendered with the earlier options, or they would be served as cached
+        for name in os.listdir(output_dir):
+            if name == LAZY_PLAN_FILENAME or (lazy and name.endswith('.pdf')):
+                os.remove(os.path.join(output_dir, name))
+        start_job_manifest(job_id, output_dir)
+        site_groups = group_roster_by_site(
+            job_id, excel_path, highlight_type, uan_column, esic_column, site_column, logger
+        )
+        if not site_groups:
             job_status[job_id] = 'error'
             return False
+        site_jobs = [
+            dict(group, output_path=os.path.join(output_dir, site_output_filename(group)))
+            for group in site_groups
+        ]
         
-        sites = df[site_column].dropna().unique()
-        total_sites = len(sites)
+        total_sites = len(site_jobs)
         job_progress[job_id] = 0
         
-        for idx, site in enumerate(sites):
-            site_df = df[df[site_column] == site]
-            number_dict = {}
-            
-            for _, row in site_df.iterrows():
-                number = str(row[target_column]).strip()
-                if not number or number == "nan":
-                    continue
-                clean_number = number.replace(" ", "")
-                number_dict[clean_number] = "regular"
-            
-            if not number_dict:
-                continue
-            
-            safe_site_name = ''.join(c if c.isalnum() else '_' for c in str(site))
-            output_path = os.path.join(output_dir, f"{safe_site_name}_{highlight_type}.pdf")
-            
-            success = process_pdf_for_site(
-                pdf_path=pdf_path,
-                output_path=output_path,
-                number_dict=number_dict,
-                site_name=site,
-                highlight_type=highlight_type,
-                expand_left=expand_left,
-                expand_right=expand_right,
-                expand_top=expand_top,
-                expand_bottom=expand_bottom,
-                border_color=border_color,
-                special_color=special_color,
-                border_width=border_width,
-                highlight_mode=highlight_mode,
-                highlight_opacity=highlight_opacity,
-                logger=logger
+        render_options = make_render_options(
+            expand_left=expand_left,
+            expand_right=expand_right,
+            expand_top=expand_top,
+            expand_bottom=expand_bottom,
+            border_color=border_color,
+            special_color=special_color,
+            border_width=border_width,
+            highlight_mode=highlight_mode,
+            highlight_opacity=highlight_opacity,
+            flatten=flatten,
+            save_profile=save_profile
+        )
+        
+        # Parse the source PDF once and share it between the index pass and every site
+        with job_span(job_id, 'pdf_open'):
+            source_doc = fitz.open(pdf_path)
+        
+        try:
+            index_start = time.perf_counter()
+            number_index, cache_hit = load_number_index(pdf_path, pdf_hash, source_doc=source_doc, logger=logger)
+            index_seconds = time.perf_counter() - index_start
+            record_span(job_id, 'index', index_seconds, cache='hit' if cache_hit else 'miss')
+            logger.info(
+                f"Number index {'loaded' if cache_hit else 'built'} in {index_seconds:.2f}s "
+                f"({number_index['page_count']} pages, {len(number_index['numbers'])} distinct numbers)"
             )
             
-            job_progress[job_id] = int(((idx + 1) / total_sites) * 100)
+            if lazy:
+                sites = write_lazy_plan(job_id, output_dir, pdf_path, pdf_hash, number_index, site_jobs, render_options)
+                logger.info(f"Planned {len(sites)} of {total_sites} site PDFs for rendering on first download")
+                job_stats[job_id] = {
+                    'render_mode': 'lazy',
+                    'highlight_types': sorted({group['highlight_type'] for group in site_groups}),
+                    'pages': number_index['page_count'],
+                    'index_cache': 'hit' if cache_hit else 'miss',
+                    'index_seconds': round(index_seconds, 3),
+                    'sites_planned': len(sites)
+                }
+                job_progress[job_id] = 100
+                job_status[job_id] = 'completed'
+                return True
+            
+            annotate_start = time.perf_counter()
+            workers = min(workers, len(site_jobs))
+            if workers > 1:
+                logger.info(f"Rendering {len(site_jobs)} sites with {workers} worker processes")
+                site_results = render_sites_in_pool(job_id, pdf_path, output_dir, number_index, site_jobs, render_options, workers)
+            else:
+                site_results = []
+                for idx, site_job in enumerate(site_jobs):
+                    publish_job_event(job_id, 'progress', {
+                        'progress': job_progress[job_id],
+                        'status': 'processing',
+                        'site': str(site_job['site_name'])
+                    })
+                    result = process_pdf_for_site(
+                        pdf_path=pdf_path,
+                        logger=logger,
+                        number_index=number_index,
+                        source_doc=source_doc,
+                        **site_job,
+                        **render_options
+                    )
+                    site_results.append(result)
+                    report_site_done(job_id, output_dir, idx + 1, len(site_jobs), result)
+        finally:
+            source_doc.close()
+        
+        annotate_seconds = time.perf_counter() - annotate_start
+        logger.info(f"Annotation pass finished in {annotate_seconds:.2f}s for {total_sites} site PDFs")
+        written = [result for result in site_results if result]
+        bytes_written = sum(result['bytes'] for result in written)
+        save_seconds = sum(result['save_seconds'] for result in written)
+        logger.info(
+            f"Saved {len(written)} site PDFs with the '{save_profile}' profile: "
+            f"{bytes_written} bytes in {save_seconds:.2f}s"
+        )
+        job_stats[job_id] = {
+            'render_mode': 'eager',
+            'highlight_types': sorted({group['highlight_type'] for group in site_groups}),
+            'pages': number_index['page_count'],
+            'index_cache': 'hit' if cache_hit else 'miss',
+            'index_seconds': round(index_seconds, 3),
+            'annotate_seconds': round(annotate_seconds, 3),
+            'save_profile': save_profile,
+            'save_seconds': round(save_seconds, 3),
+            'bytes_written': bytes_written,
+            'files_written': len(written)
+        }
             
         job_status[job_id] = 'completed'
         return True
     
+    except JobCancelled:
+        logger.info(f"Highlight job {job_id} cancelled after {len(job_manifests.get(job_id, []))} site PDFs")
+        job_status[job_id] = 'cancelled'
+        return False
     except Exception as e:
         logger.error(f"Error in highlight_uans_by_site: {e}")
         job_status[job_id] = 'error'
         return False
 
+# Process-pool rendering: each worker opens the source PDF once and receives the
+# number index once through the pool initializer, then renders whole sites.
+_site_worker_state = {}
+
+def _init_site_worker(pdf_path, number_index):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    _site_worker_state['pdf_path'] = pdf_path
+    _site_worker_state['number_index'] = number_index
+    _site_worker_state['source_doc'] = fitz.open(pdf_path)
+
+def _render_site_in_worker(site_job):
+    return process_pdf_for_site(
+        pdf_path=_site_worker_state['pdf_path'],
+        logger=logging.getLogger(),
+        number_index=_site_worker_state['number_index'],
+        source_doc=_site_worker_state['source_doc'],
+        **site_job
+    )
+
+def render_sites_in_pool(job_id, pdf_path, output_dir, number_index, site_jobs, render_options, workers):
+    # Spawned (not forked) workers, so the pool is safe to start from the Flask job thread
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_site_worker,
+        initargs=(pdf_path, number_index)
+    ) as pool:
+        futures = [pool.submit(_render_site_in_worker, dict(site_job, **render_options)) for site_job in site_jobs]
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                report_site_done(job_id, output_dir, done, len(site_jobs), future.result())
+        except JobCancelled:
+            # Sites not started yet are dropped; the ones being rendered finish first
+            pool.shutdown(cancel_futures=True)
+            raise
+    # Results in site order, as the serial path produces them
+    return [future.result() for future in futures]
+
+# Lazy rendering: the job only plans each site from the number index, and a site
+# PDF is rendered the first time it is downloaded and kept for later requests
+LAZY_PLAN_FILENAME = 'lazy_plan.json'
+lazy_render_locks = {}
+lazy_render_locks_lock = threading.Lock()
+
+def summarize_site_from_index(number_index, number_dict, highlight_type):
+    # Match and page counts of the site PDF, as process_pdf_for_site would write it
+    pages = {0}
+    if highlight_type == 'uan':
+        pages.add(number_index['page_count'] - 1)
+    matches = 0
+    for number in number_dict:
+        hits = number_index['numbers'].get(number, ())
+        matches += len(hits)
+        pages.update(page_num for page_num, _ in hits)
+    return matches, len(pages)
+
+def write_lazy_plan(job_id, output_dir, pdf_path, pdf_hash, number_index, site_jobs, render_options):
+    """Write the lazy plan and a manifest listing every site with matches, unrendered."""
+    sites = []
+    planned = []
+    for site_job in site_jobs:
+        matches, pages = summarize_site_from_index(number_index, site_job['number_dict'], site_job['highlight_type'])
+        if not matches:
+            continue
+        filename = os.path.basename(site_job['output_path'])
+        sites.append({
+            'site': str(site_job['site_name']),
+            'file': filename,
+            'matches': matches,
+            'pages': pages,
+            'bytes': None,
+            'rendered': False
+        })
+        planned.append({
+            'file': filename,
+            'site_name': str(site_job['site_name']),
+            'highlight_type': site_job['highlight_type'],
+            'number_dict': site_job['number_dict']
+        })
+    
+    plan = {
+        'pdf_path': pdf_path,
+        'pdf_hash': pdf_hash or file_sha256(pdf_path),
+        'render_options': render_options,
+        'sites': planned
+    }
+    plan_path = os.path.join(output_dir, LAZY_PLAN_FILENAME)
+    with open(f"{plan_path}.part", 'w') as f:
+        json.dump(plan, f)
+    os.replace(f"{plan_path}.part", plan_path)
+    
+    job_manifests[job_id] = sites
+    write_job_manifest(output_dir, sites)
+    return sites
+
+def read_lazy_plan(output_dir):
+    try:
+        with open(os.path.join(output_dir, LAZY_PLAN_FILENAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def wait_for_lazy_renders(job_id):
+    # Lets site PDFs of the job being rendered by other requests finish
+    with lazy_render_locks_lock:
+        locks = [lock for (lock_job_id, _), lock in lazy_render_locks.items() if lock_job_id == job_id]
+    for lock in locks:
+        with lock:
+            pass
+
+def render_lazy_site(job_id, output_dir, filename, logger):
+    """Return the path of a site PDF, rendering it first if it is planned but not yet written.
+
+    Returns None if the file is not part of the job's lazy plan or could not be rendered.
+    """
+    output_path = os.path.join(output_dir, filename)
+    if os.path.exists(output_path):
+        return output_path
+    plan = read_lazy_plan(output_dir)
+    if plan is None:
+        return None
+    planned = next((site for site in plan['sites'] if site['file'] == filename), None)
+    if planned is None:
+        return None
+    
+    with lazy_render_locks_lock:
+        lock = lazy_render_locks.setdefault((job_id, filename), threading.Lock())
+    with lock:
+        # A concurrent request may have rendered it while this one waited
+        if os.path.exists(output_path):
+            return output_path
+        # Or the job may have been cleaned up
+        if not os.path.exists(os.path.join(output_dir, LAZY_PLAN_FILENAME)):
+            return None
+        render_start = time.perf_counter()
+        number_index, _ = load_number_index(plan['pdf_path'], plan['pdf_hash'], logger=logger)
+        render_options = dict(plan['render_options'])
+        render_options['border_color'] = tuple(render_options['border_color'])
+        render_options['special_color'] = tuple(render_options['special_color'])
+        result = process_pdf_for_site(
+            pdf_path=plan['pdf_path'],
+            output_path=output_path,
+            number_dict=planned['number_dict'],
+            site_name=planned['site_name'],
+            highlight_type=planned['highlight_type'],
+            logger=logger,
+            number_index=number_index,
+            **render_options
+        )
+        if result is None:
+            return None
+        mark_site_rendered(job_id, output_dir, result)
+        logger.info(f"Rendered {filename} on demand in {time.perf_counter() - render_start:.2f}s")
+    return output_path
+
+def mark_site_rendered(job_id, output_dir, result):
+    record_site_spans(job_id, result)
+    with lazy_render_locks_lock:
+        sites = job_manifests.get(job_id)
+        if sites is None:
+            sites = read_job_manifest(output_dir) or []
+            job_manifests[job_id] = sites
+        for site in sites:
+            if site['file'] == result['file']:
+                site['bytes'] = result['bytes']
+                site['rendered'] = True
+        write_job_manifest(output_dir, sites)
+
+def iter_lazy_outputs(job_id, output_dir, logger):
+    # (path, arcname) for every planned site, rendering missing ones as the ZIP reaches them
+    for site in read_lazy_plan(output_dir)['sites']:
+        file_path = render_lazy_site(job_id, output_dir, site['file'], logger)
+        if file_path:
+            yield file_path, site['file']
+
+# Batch jobs: one roster against several PDFs (e.g. the months of a quarter). The
+# roster is grouped once; each PDF is then indexed and rendered on its own, several
+# at a time in worker processes when workers > 1. Outputs of all PDFs go to the job's
+# output folder, prefixed with the PDF's name, next to a consolidated summary.
+BATCH_SUMMARY_FILENAME = 'batch_summary.json'
+
+def render_pdf_sites(pdf_path, pdf_hash, site_jobs, render_options, logger, on_site=None):
+    """Index one PDF and render every site job against it.
+
+    Returns (results, info): results in site_jobs order (None for sites without
+    matches), and info with the page count, index cache use and timings.
+    """
+    start = time.perf_counter()
+    source_doc = fitz.open(pdf_path)
+    open_seconds = time.perf_counter() - start
+    try:
+        number_index, cache_hit = load_number_index(pdf_path, pdf_hash, source_doc=source_doc, logger=logger)
+        info = {
+            'pages': number_index['page_count'],
+            'index_cache': 'hit' if cache_hit else 'miss',
+            'open_seconds': round(open_seconds, 3),
+            'index_seconds': round(time.perf_counter() - start - open_seconds, 3)
+        }
+        results = []
+        for site_job in site_jobs:
+            result = process_pdf_for_site(
+                pdf_path=pdf_path,
+                logger=logger,
+                number_index=number_index,
+                source_doc=source_doc,
+                **site_job,
+                **render_options
+            )
+            results.append(result)
+            if on_site:
+                on_site(result)
+    finally:
+        source_doc.close()
+    info['seconds'] = round(time.perf_counter() - start, 3)
+    return results, info
+
+def record_pdf_spans(job_id, pdf_name, info):
+    record_span(job_id, 'pdf_open', info['open_seconds'], pdf=pdf_name)
+    record_span(job_id, 'index', info['index_seconds'], pdf=pdf_name, cache=info['index_cache'])
+
+def _init_batch_worker():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def _render_pdf_in_worker(pdf_job):
+    return render_pdf_sites(logger=logging.getLogger(), **pdf_job)
+
+def summarize_batch(pdf_names, site_groups, pdf_results):
+    """Consolidate per-PDF results into per-PDF totals, a site x PDF match table and overall totals.
+
+    pdf_results maps a PDF name to (results, info), or to an error message.
+    """
+    pdfs = []
+    site_matches = [dict.fromkeys(pdf_names, 0) for _ in site_groups]
+    for pdf_name in pdf_names:
+        outcome = pdf_results.get(pdf_name, 'Not processed')
+        if isinstance(outcome, str):
+            pdfs.append({'pdf': pdf_name, 'error': outcome, 'files_written': 0, 'matches': 0, 'bytes_written': 0})
+            continue
+        results, info = outcome
+        written = [result for result in results if result]
+        for idx, result in enumerate(results):
+            if result:
+                site_matches[idx][pdf_name] = result['matches']
+        pdfs.append(dict(
+            info,
+            pdf=pdf_name,
+            error=None,
+            files_written=len(written),
+            matches=sum(result['matches'] for result in written),
+            bytes_written=sum(result['bytes'] for result in written)
+        ))
+    
+    sites = [
+        {
+            'site': str(group['site_name']),
+            'highlight_type': group['highlight_type'],
+            'matches': matches,
+            'total_matches': sum(matches.values())
+        }
+        for group, matches in zip(site_groups, site_matches)
+    ]
+    totals = {
+        'pdfs': len(pdf_names),
+        'failed_pdfs': sum(1 for pdf in pdfs if pdf['error']),
+        'files_written': sum(pdf['files_written'] for pdf in pdfs),
+        'matches': sum(pdf['matches'] for pdf in pdfs),
+        'bytes_written': sum(pdf['bytes_written'] for pdf in pdfs)
+    }
+    return {'pdfs': pdfs, 'sites': sites, 'totals': totals}
+
+def read_batch_summary(output_dir):
+    try:
+        with open(os.path.join(output_dir, BATCH_SUMMARY_FILENAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def highlight_batch_by_site(
+    job_id,
+    excel_path,
+    pdf_paths,
+    output_dir,
+    highlight_type,
+    uan_column,
+    esic_column,
+    site_column,
+    logger=None,
+    workers=1,
+    pdf_hashes=None,
+    **render_kwargs
+):
+    """Highlight one roster's numbers in every PDF of pdf_paths; see highlight_uans_by_site."""
+    if logger is None:
+        logger = logging.getLogger()
+    pdf_hashes = pdf_hashes or {}
+    os.makedirs(output_dir, exist_ok=True)
+    
+    try:
+        start = time.perf_counter()
+        if os.path.exists(os.path.join(output_dir, BATCH_SUMMARY_FILENAME)):
+            os.remove(os.path.join(output_dir, BATCH_SUMMARY_FILENAME))
+        start_job_manifest(job_id, output_dir)
+        site_groups = group_roster_by_site(
+            job_id, excel_path, highlight_type, uan_column, esic_column, site_column, logger
+        )
+        if not site_groups:
+            job_status[job_id] = 'error'
+            return False
+        render_options = make_render_options(**render_kwargs)
+        
+        pdf_names = [os.path.basename(pdf_path) for pdf_path in pdf_paths]
+        pdf_jobs = {}
+        for pdf_name, pdf_path in zip(pdf_names, pdf_paths):
+            prefix = ''.join(c if c.isalnum() else '_' for c in os.path.splitext(pdf_name)[0]) + '_'
+            pdf_jobs[pdf_name] = {
+                'pdf_path': pdf_path,
+                'pdf_hash': pdf_hashes.get(pdf_name),
+                'site_jobs': [
+                    dict(group, output_path=os.path.join(output_dir, site_output_filename(group, prefix)))
+                    for group in site_groups
+                ],
+                'render_options': render_options
+            }
+        
+        total = len(pdf_jobs) * len(site_groups)
+        done = 0
+        job_progress[job_id] = 0
+        pdf_results = {}
+        
+        def site_done(pdf_name, result):
+            nonlocal done
+            done += 1
+            if result:
+                result['pdf'] = pdf_name
+            report_site_done(job_id, output_dir, done, total, result)
+        
+        workers = min(workers, len(pdf_jobs))
+        logger.info(
+            f"Batch of {len(pdf_jobs)} PDFs x {len(site_groups)} site outputs, "
+            f"{workers} at a time"
+        )
+        if workers > 1:
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_batch_worker) as pool:
+                futures = {pool.submit(_render_pdf_in_worker, pdf_job): pdf_name for pdf_name, pdf_job in pdf_jobs.items()}
+                try:
+                    for future in as_completed(futures):
+                        pdf_name = futures[future]
+                        try:
+                            pdf_results[pdf_name] = future.result()
+                        except Exception as e:
+                            logger.error(f"Batch PDF {pdf_name} failed: {e}")
+                            pdf_results[pdf_name] = str(e)
+                            continue
+                        record_pdf_spans(job_id, pdf_name, pdf_results[pdf_name][1])
+                        for result in pdf_results[pdf_name][0]:
+                            site_done(pdf_name, result)
+                except JobCancelled:
+                    # PDFs not started yet are dropped; the ones being rendered finish first
+                    pool.shutdown(cancel_futures=True)
+                    raise
+        else:
+            for pdf_name, pdf_job in pdf_jobs.items():
+                publish_job_event(job_id, 'progress', {
+                    'progress': job_progress[job_id],
+                    'status': 'processing',
+                    'site': pdf_name
+                })
+                try:
+                    pdf_results[pdf_name] = render_pdf_sites(
+                        logger=logger,
+                        on_site=lambda result, pdf_name=pdf_name: site_done(pdf_name, result),
+                        **pdf_job
+                    )
+                    record_pdf_spans(job_id, pdf_name, pdf_results[pdf_name][1])
+                except JobCancelled:
+                    raise
+                except Exception as e:
+                    logger.error(f"Batch PDF {pdf_name} failed: {e}")
+                    pdf_results[pdf_name] = str(e)
+        
+        summary = summarize_batch(pdf_names, site_groups, pdf_results)
+        summary['totals']['seconds'] = round(time.perf_counter() - start, 3)
+        summary_path = os.path.join(output_dir, BATCH_SUMMARY_FILENAME)
+        with open(f"{summary_path}.part", 'w') as f:
+            json.dump(summary, f, indent=2)
+        os.replace(f"{summary_path}.part", summary_path)
+        
+        totals = summary['totals']
+        logger.info(
+            f"Batch finished in {totals['seconds']:.2f}s: {totals['files_written']} site PDFs, "
+            f"{totals['matches']} matches, {totals['failed_pdfs']} of {totals['pdfs']} PDFs failed"
+        )
+        job_stats[job_id] = dict(
+            totals,
+            render_mode='batch',
+            workers=workers,
+            save_profile=render_options['save_profile'],
+            pdf_stats=summary['pdfs']
+        )
+        job_progress[job_id] = 100
+        job_status[job_id] = 'error' if totals['failed_pdfs'] == totals['pdfs'] else 'completed'
+        return job_status[job_id] == 'completed'
+    
+    except JobCancelled:
+        logger.info(f"Batch job {job_id} cancelled after {len(job_manifests.get(job_id, []))} site PDFs")
+        job_status[job_id] = 'cancelled'
+        return False
+    except Exception as e:
+        logger.error(f"Error in highlight_batch_by_site: {e}")
+        job_status[job_id] = 'error'
+        return False
+
+# Document.save options per save profile: 'fast' only drops unused objects,
+# 'balanced' also compacts the xref and compresses new streams, and 'smallest'
+# additionally merges duplicate objects and streams (slowest)
+SAVE_PROFILES = {
+    'fast': {'garbage': 1, 'deflate': False},
+    'balanced': {'garbage': 2, 'deflate': True},
+    'smallest': {'garbage': 4, 'deflate': True}
+}
+
+def _page_ranges(page_nums):
+    # Collapse sorted page numbers into (first, last) runs of consecutive pages
+    ranges = []
+    for page_num in page_nums:
+        if ranges and page_num == ranges[-1][1] + 1:
+            ranges[-1][1] = page_num
+        else:
+            ranges.append([page_num, page_num])
+    return ranges
+
+# Drawing helpers. Each mark is (match_rect, expanded_rect, color).
+def draw_marks_as_annotations(page, marks, highlight_mode, border_width, highlight_opacity):
+    # One editable rectangle annotation per match (underlines go into the page content)
+    for rect, expanded_rect, color in marks:
+        if highlight_mode == "border":
+            annot = page.add_rect_annot(expanded_rect)
+            annot.set_border(width=border_width)
+            annot.set_colors(stroke=color[:3])
+            annot.set_colors(fill=None)
+            annot.update()
+        elif highlight_mode == "highlight":
+            annot = page.add_rect_annot(expanded_rect)
+            annot.set_opacity(highlight_opacity)
+            annot.set_colors(fill=color[:3])
+            annot.set_border(width=0)
+            annot.update()
+        elif highlight_mode == "underline":
+            underline_y = rect.y1 + 0.5
+            page.draw_line(
+                (rect.x0, underline_y),
+                (rect.x1, underline_y),
+                color=color[:3],
+                width=border_width
+            )
+
+def draw_marks_flattened(page, marks, highlight_mode, border_width, highlight_opacity):
+    # All marks of a page are drawn with one Shape and committed to the page
+    # content in a single step; marks sharing a color share one finish() call
+    shape = page.new_shape()
+    marks_by_color = {}
+    for mark in marks:
+        marks_by_color.setdefault(tuple(mark[2][:3]), []).append(mark)
+    
+    for color, color_marks in marks_by_color.items():
+        for rect, expanded_rect, _ in color_marks:
+            if highlight_mode == "underline":
+                underline_y = rect.y1 + 0.5
+                shape.draw_line((rect.x0, underline_y), (rect.x1, underline_y))
+            else:
+                shape.draw_rect(expanded_rect)
+        if highlight_mode == "border":
+            shape.finish(color=color, fill=None, width=border_width)
+        elif highlight_mode == "highlight":
+            shape.finish(color=None, fill=color, fill_opacity=highlight_opacity, width=0)
+        elif highlight_mode == "underline":
+            shape.finish(color=color, width=border_width)
+    shape.commit(overlay=True)
+
 def process_pdf_for_site(
     pdf_path,
     output_path,
@@ -226,71 +1780,581 @@ def process_pdf_for_site(
     border_width,
     highlight_mode,
     highlight_opacity,
-    logger
+    logger,
+    number_index=None,
+    source_doc=None,
+    flatten=False,
+    save_profile='smallest'
 ):
+    """Write the site's highlighted page subset to output_path.
+
+    Returns a dict with the site name, output file name, match count, page
+    count, bytes written and seconds spent saving, or None if the site had no
+    matches or the output could not be written.
+    """
     try:
-        doc = fitz.open(pdf_path)
-        total_matches = 0
-        pages_to_keep = set([0])
-        if highlight_type == 'uan':
-            pages_to_keep.add(len(doc) - 1)
+        if number_index is None:
+            number_index = build_number_index(pdf_path, source_doc=source_doc)
         
-        for page_num, page in enumerate(doc):
-            page_matches = 0
-            for number, highlight_type_item in number_dict.items():
-                if not number:
-                    continue
-                found_instances = page.search_for(number)
-                if found_instances:
-                    for rect in found_instances:
-                        expanded_rect = fitz.Rect(
-                            rect.x0 - expand_left,
-                            rect.y0 - expand_top,
-                            rect.x1 + expand_right,
-                            rect.y1 + expand_bottom
-                        )
-                        color = special_color if highlight_type_item == "special" else border_color
-                        
-                        if highlight_mode == "border":
-                            annot = page.add_rect_annot(expanded_rect)
-                            annot.set_border(width=border_width)
-                            annot.set_colors(stroke=color[:3])
-                            annot.set_colors(fill=None)
-                            annot.update()
-                        elif highlight_mode == "highlight":
-                            annot = page.add_rect_annot(expanded_rect)
-                            annot.set_opacity(highlight_opacity)
-                            annot.set_colors(fill=color[:3])
-                            annot.set_border(width=0)
-                            annot.update()
-                        elif highlight_mode == "underline":
-                            underline_y = rect.y1 + 0.5
-                            page.draw_line(
-                                start=(rect.x0, underline_y),
-                                end=(rect.x1, underline_y),
-                                color=color[:3],
-                                width=border_width
-                            )
-                        page_matches += 1
-            if page_matches > 0:
-                pages_to_keep.add(page_num)
-            total_matches += page_matches
-        
-        if total_matches > 0:
+        # Look up every number in the index and group the hits by page
+        page_hits = {}
+        for number, highlight_type_item in number_dict.items():
+            if not number:
+                continue
+            for page_num, rect in number_index['numbers'].get(number, ()):
+                page_hits.setdefault(page_num, []).append((fitz.Rect(rect), highlight_type_item))
+        
+        if not page_hits:
+            return None
+        
+        doc = fitz.open(pdf_path) if source_doc is None else source_doc
+        try:
+            pages_to_keep = set([0])
+            if highlight_type == 'uan':
+                pages_to_keep.add(len(doc) - 1)
+            pages_to_keep.update(page_hits)
+            
+            # Copy the page subset first and annotate the copies, so the shared
+            # source document never carries one site's annotations into another
+            annotate_start = time.perf_counter()
             new_doc = fitz.open()
-            for page_num in sorted(pages_to_keep):
-                new_doc.insert_pdf(doc, from_page=page_num, to_page=page_num)
-            new_doc.save(output_path, garbage=4, deflate=True)
+            for first_page, last_page in _page_ranges(sorted(pages_to_keep)):
+                new_doc.insert_pdf(doc, from_page=first_page, to_page=last_page)
+            
+            total_matches = 0
+            for new_page_num, page_num in enumerate(sorted(pages_to_keep)):
+                if page_num not in page_hits:
+                    continue
+                marks = []
+                for rect, highlight_type_item in page_hits[page_num]:
+                    expanded_rect = fitz.Rect(
+                        rect.x0 - expand_left,
+                        rect.y0 - expand_top,
+                        rect.x1 + expand_right,
+                        rect.y1 + expand_bottom
+                    )
+                    color = special_color if highlight_type_item == "special" else border_color
+                    marks.append((rect, expanded_rect, color))
+                total_matches += len(marks)
+                
+                page = new_doc[new_page_num]
+                if flatten:
+                    draw_marks_flattened(page, marks, highlight_mode, border_width, highlight_opacity)
+                else:
+                    draw_marks_as_annotations(page, marks, highlight_mode, border_width, highlight_opacity)
+            
+            # Save under a temporary name and rename, so a site PDF offered for
+            # download while the job is still running is always complete
+            save_start = time.perf_counter()
+            annotate_seconds = save_start - annotate_start
+            part_path = f"{output_path}.part"
+            new_doc.save(part_path, **SAVE_PROFILES[save_profile])
+            os.replace(part_path, output_path)
+            save_seconds = time.perf_counter() - save_start
+            page_count = len(new_doc)
             new_doc.close()
-            doc.close()
-            return True
-        else:
-            doc.close()
-            return False
+            return {
+                'site': str(site_name),
+                'file': os.path.basename(output_path),
+                'matches': total_matches,
+                'pages': page_count,
+                'bytes': os.path.getsize(output_path),
+                'annotate_seconds': round(annotate_seconds, 3),
+                'save_seconds': round(save_seconds, 3)
+            }
+        finally:
+            if source_doc is None:
+                doc.close()
             
     except Exception as e:
         logger.error(f"Error processing PDF for site {site_name}: {e}")
-        return False
+        return None
+
+# --- Persistent job queue ---
+# Jobs are stored in SQLite so they survive a restart. A fixed number of worker
+# threads take queued jobs by priority (highest first), then in submission order.
+# job_progress/job_status stay the in-memory view used while a job runs.
+job_queue_condition = threading.Condition()
+job_workers = []
+# Priorities sent with /process and /pf_upload are clamped to this range
+JOB_PRIORITY_MIN = -10
+JOB_PRIORITY_MAX = 10
+
+def parse_job_options(form, default_workers):
+    """Return (workers, priority) from a request form, clamped to their ranges.
+
+    Raises ValueError if either value is not an integer.
+    """
+    workers = max(1, min(int(form.get('workers', default_workers)), os.cpu_count() or 1))
+    priority = max(JOB_PRIORITY_MIN, min(int(form.get('priority', '0')), JOB_PRIORITY_MAX))
+    return workers, priority
+
+def get_job_db():
+    conn = sqlite3.connect(app.config['JOB_DB_PATH'], timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def init_job_db():
+    conn = get_job_db()
+    with conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id TEXT UNIQUE NOT NULL,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL,
+            error TEXT,
+            submitted_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT
+        )''')
+    conn.close()
+
+def submit_job(job_id, kind, params, priority=0):
+    """Queue a job. Returns False if the job is already queued or running."""
+    start_job_workers()
+    conn = get_job_db()
+    try:
+        with conn:
+            row = conn.execute('SELECT status FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+            if row is not None and row['status'] in ('queued', 'processing'):
+                return False
+            # REPLACE gives a re-submitted job a new seq, i.e. a place at the back of the queue
+            conn.execute(
+                'INSERT OR REPLACE INTO jobs (job_id, kind, params, priority, status, submitted_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, kind, json.dumps(params), priority, 'queued', datetime.now().isoformat())
+            )
+    finally:
+        conn.close()
+    job_progress[job_id] = 0
+    job_status[job_id] = 'queued'
+    with job_events_condition:
+        job_events[job_id] = []
+    with job_queue_condition:
+        job_queue_condition.notify()
+    return True
+
+def get_job_record(job_id):
+    conn = get_job_db()
+    try:
+        row = conn.execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+    finally:
+        conn.close()
+
+def get_queue_position(job_id):
+    # 1-based position among queued jobs, or None if the job is not queued
+    conn = get_job_db()
+    try:
+        row = conn.execute(
+            "SELECT seq, priority FROM jobs WHERE job_id = ? AND status = 'queued'", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        ahead = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (priority > ? OR (priority = ? AND seq < ?))",
+            (row['priority'], row['priority'], row['seq'])
+        ).fetchone()[0]
+        return ahead + 1
+    finally:
+        conn.close()
+
+def delete_job_record(job_id):
+    conn = get_job_db()
+    with conn:
+        conn.execute('DELETE FROM jobs WHERE job_id = ?', (job_id,))
+    conn.close()
+
+def _claim_next_job():
+    with job_queue_condition:
+        conn = get_job_db()
+        try:
+            with conn:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY priority DESC, seq LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'processing', started_at = ? WHERE seq = ?",
+                    (datetime.now().isoformat(), row['seq'])
+                )
+        finally:
+            conn.close()
+    return dict(row)
+
+def _finish_job(job_id, status, error=None):
+    conn = get_job_db()
+    with conn:
+        conn.execute(
+            'UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE job_id = ?',
+            (status, error, datetime.now().isoformat(), job_id)
+        )
+    conn.close()
+
+def _job_worker_loop():
+    while True:
+        job = _claim_next_job()
+        if job is None:
+            with job_queue_condition:
+                job_queue_condition.wait(timeout=5)
+            continue
+        
+        job_id = job['job_id']
+        # A cancel request that arrived as an earlier run of this job ended is not for this run
+        job_cancel_requests.discard(job_id)
+        job_progress[job_id] = 0
+        job_status[job_id] = 'processing'
+        job_pages.pop(job_id, None)
+        # A re-run keeps only the spans of the upload it works on
+        job_spans[job_id] = [span for span in job_spans.get(job_id, []) if span.get('upload')]
+        publish_job_event(job_id, 'progress', {'progress': 0, 'status': 'processing'})
+        logger = setup_logging()
+        error = None
+        job_start = time.perf_counter()
+        try:
+            JOB_HANDLERS[job['kind']](job_id, json.loads(job['params']), logger)
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            job_status[job_id] = 'error'
+            error = str(e)
+        if job_status.get(job_id) not in ('completed', 'error', 'cancelled'):
+            job_status[job_id] = 'error'
+        job_cancel_requests.discard(job_id)
+        record_job_metrics(job['kind'], job_status[job_id], time.perf_counter() - job_start, job_stats.get(job_id) or {})
+        logger.info(f"Job {job_id} stage timings: {json.dumps(summarize_spans(job_spans.get(job_id)))}")
+        _finish_job(job_id, job_status[job_id], error)
+        publish_job_event(job_id, 'status', {'progress': job_progress.get(job_id, 0), 'status': job_status[job_id]})
+
+def record_job_metrics(kind, status, seconds, stats):
+    inc_counter('fortune_jobs_total', kind=kind, status=status)
+    observe('fortune_job_duration_seconds', seconds, kind=kind)
+    # Batch jobs report pages per PDF
+    pages = stats.get('pages') or sum(pdf.get('pages', 0) for pdf in stats.get('pdf_stats', []))
+    if pages:
+        inc_counter('fortune_pages_processed_total', pages, kind=kind)
+        if seconds > 0:
+            observe('fortune_job_pages_per_second', pages / seconds, kind=kind)
+    if stats.get('bytes_written'):
+        inc_counter('fortune_bytes_written_total', stats['bytes_written'], kind=kind)
+
+def queue_depth():
+    # Queued and running jobs, from the persistent queue
+    conn = get_job_db()
+    try:
+        rows = conn.execute(
+            "SELECT status, COUNT(*) AS jobs FROM jobs WHERE status IN ('queued', 'processing') GROUP BY status"
+        ).fetchall()
+    finally:
+        conn.close()
+    depth = dict.fromkeys(ACTIVE_JOB_STATES, 0)
+    depth.update({row['status']: row['jobs'] for row in rows})
+    return depth
+
+def recover_jobs(logger=None):
+    # Jobs left 'processing' by a previous run are queued again, or marked as errors
+    if logger is None:
+        logger = logging.getLogger()
+    conn = get_job_db()
+    with conn:
+        rows = conn.execute("SELECT job_id FROM jobs WHERE status = 'processing'").fetchall()
+        for row in rows:
+            if app.config['JOB_RESUME_ON_RESTART']:
+                conn.execute("UPDATE jobs SET status = 'queued', started_at = NULL WHERE job_id = ?", (row['job_id'],))
+                logger.info(f"Re-queued job interrupted by restart: {row['job_id']}")
+            else:
+                conn.execute(
+                    "UPDATE jobs SET status = 'error', error = ?, finished_at = ? WHERE job_id = ?",
+                    ('Interrupted by server restart', datetime.now().isoformat(), row['job_id'])
+                )
+                logger.info(f"Marked job interrupted by restart as failed: {row['job_id']}")
+    conn.close()
+
+def start_job_workers():
+    # Started on first use rather than at import, so process-pool children and
+    # scripts importing this module do not start queue workers of their own
+    with job_queue_condition:
+        if job_workers:
+            return
+        recover_jobs()
+        for _ in range(max(1, app.config['JOB_WORKERS'])):
+            worker = threading.Thread(target=_job_worker_loop, daemon=True)
+            worker.start()
+            job_workers.append(worker)
+
+def run_highlight_job(job_id, params, logger):
+    params = dict(params)
+    params['border_color'] = tuple(params['border_color'])
+    highlight_uans_by_site(job_id=job_id, logger=logger, **params)
+
+def run_highlight_batch_job(job_id, params, logger):
+    params = dict(params)
+    params['border_color'] = tuple(params['border_color'])
+    highlight_batch_by_site(job_id=job_id, logger=logger, **params)
+
+def highlight_job_params(excel_path, pdf_paths, output_dir, pdf_hashes=None, lazy=False, **options):
+    """Return (kind, params) of the highlight job for one roster and one or more PDFs.
+
+    pdf_hashes is the PDF's hash for a single PDF, or a dict of file name -> hash.
+    """
+    params = dict(options, excel_path=excel_path, output_dir=output_dir)
+    if len(pdf_paths) > 1:
+        return 'highlight_batch', dict(params, pdf_paths=list(pdf_paths), pdf_hashes=pdf_hashes)
+    return 'highlight', dict(params, pdf_path=pdf_paths[0], pdf_hash=pdf_hashes, lazy=lazy)
+
+def run_pf_mismatch_job(job_id, params, logger):
+    def on_page(done, total):
+        job_pages[job_id] = {'pages_processed': done, 'total_pages': total}
+        job_progress[job_id] = int((done / total) * 100)
+        publish_job_event(job_id, 'progress', dict(job_pages[job_id], progress=job_progress[job_id], status='processing'))
+        if job_id in job_cancel_requests:
+            raise JobCancelled()
+    
+    extract_start = time.perf_counter()
+    try:
+        data = extract_ecr_rows(
+            params['pdf_path'],
+            on_page=on_page,
+            workers=params.get('workers', 1),
+            engine=params.get('engine', 'pdfplumber')
+        )
+    except JobCancelled:
+        logger.info(f"PF mismatch job {job_id} cancelled after {job_pages.get(job_id, {}).get('pages_processed', 0)} pages")
+        job_status[job_id] = 'cancelled'
+        return
+    
+    extract_seconds = time.perf_counter() - extract_start
+    record_span(job_id, 'extract', extract_seconds, engine=params.get('engine', 'pdfplumber'))
+    compare_start = time.perf_counter()
+    df = find_name_mismatches(data)
+    compare_seconds = time.perf_counter() - compare_start
+    record_span(job_id, 'compare', compare_seconds)
+    bytes_written = 0
+    if not df.empty:
+        with job_span(job_id, 'excel_write'):
+            df.to_excel(params['output_path'], index=False)
+        bytes_written = os.path.getsize(params['output_path'])
+    pf_mismatched_data[job_id] = df
+    job_stats[job_id] = {
+        'engine': params.get('engine', 'pdfplumber'),
+        'workers': params.get('workers', 1),
+        'pages': job_pages.get(job_id, {}).get('total_pages', 0),
+        'rows_checked': len(data),
+        'mismatches': len(df),
+        'extract_seconds': round(extract_seconds, 3),
+        'compare_seconds': round(compare_seconds, 3),
+        'bytes_written': bytes_written
+    }
+    logger.info(f"PF mismatch job {job_id} found {len(df)} mismatches in {len(data)} rows")
+    job_progress[job_id] = 100
+    job_status[job_id] = 'completed'
+
+def cancel_job(job_id, wait=False, timeout=30):
+    """Cancel a queued job, or ask a running one to stop at its next page or site.
+
+    Returns False only if wait is set and the running job has not stopped within timeout.
+    """
+    conn = get_job_db()
+    with conn:
+        cancelled = conn.execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE job_id = ? AND status = 'queued'",
+            (datetime.now().isoformat(), job_id)
+        ).rowcount
+    conn.close()
+    if cancelled:
+        job_status[job_id] = 'cancelled'
+        publish_job_event(job_id, 'status', {'progress': job_progress.get(job_id, 0), 'status': 'cancelled'})
+        return True
+    
+    record = get_job_record(job_id)
+    if record is None or record['status'] != 'processing':
+        return True
+    job_cancel_requests.add(job_id)
+    deadline = time.monotonic() + timeout
+    while wait and time.monotonic() < deadline:
+        record = get_job_record(job_id)
+        if record is None or record['status'] != 'processing':
+            return True
+        time.sleep(0.2)
+    return not wait
+
+def forget_job(job_id):
+    # Drop everything held in memory and in the queue for a job; its folders are left to the caller
+    with job_events_condition:
+        for store in JOB_STATE_STORES.values():
+            store.discard(job_id)
+    with roster_store_lock:
+        roster_store.pop(job_id, None)
+    delete_job_record(job_id)
+    with lazy_render_locks_lock:
+        for key in [key for key in lazy_render_locks if key[0] == job_id]:
+            del lazy_render_locks[key]
+
+# --- Retention janitor ---
+# A background thread removes the upload and output folders of old jobs so the disk does
+# not fill up when users never press "Process New Files". Jobs are units of eviction:
+# a job's folders are removed together, oldest last use first.
+retention_threads = []
+retention_lock = threading.Lock()
+
+def _path_usage(path):
+    # Total bytes and newest modification time of a file or folder tree
+    stat = os.stat(path)
+    if not os.path.isdir(path):
+        return stat.st_size, stat.st_mtime
+    total, newest = 0, stat.st_mtime
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            total += stat.st_size
+            newest = max(newest, stat.st_mtime)
+    return total, newest
+
+def collect_job_usage():
+    """Map job_id -> {'paths', 'bytes', 'mtime'} for everything under uploads/ and outputs/."""
+    jobs = {}
+    for base in [app.config['UPLOAD_FOLDER'], os.path.join(BASE_PATH, OUTPUT_FOLDER)]:
+        try:
+            entries = list(os.scandir(base))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            job_id = entry.name
+            if entry.is_file() and job_id.endswith('.zip'):
+                job_id = job_id[:-len('.zip')]  # outputs/<job_id>.zip left by older versions
+            try:
+                size, mtime = _path_usage(entry.path)
+            except FileNotFoundError:
+                continue
+            job = jobs.setdefault(job_id, {'paths': [], 'bytes': 0, 'mtime': 0})
+            job['paths'].append(entry.path)
+            job['bytes'] += size
+            job['mtime'] = max(job['mtime'], mtime)
+    return jobs
+
+def active_job_ids():
+    # Jobs that are queued or running, according to the queue. In-memory statuses are
+    # not used: an upload that was never processed has no queue record and may be removed
+    conn = get_job_db()
+    try:
+        rows = conn.execute("SELECT job_id FROM jobs WHERE status IN ('queued', 'processing')").fetchall()
+    finally:
+        conn.close()
+    return {row['job_id'] for row in rows}
+
+def delete_in_batches(paths, batch_size, pause=0.05):
+    """Delete the files under paths batch_size at a time, then the emptied folders.
+
+    Pausing between batches keeps a large sweep from starving request handling of disk I/O.
+    Returns the number of bytes deleted.
+    """
+    files, folders = [], []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path, topdown=False):
+                files.extend(os.path.join(root, name) for name in names)
+                folders.append(root)
+        else:
+            files.append(path)
+    
+    freed = 0
+    for start in range(0, len(files), batch_size):
+        for file_path in files[start:start + batch_size]:
+            try:
+                size = os.path.getsize(file_path)
+                os.remove(file_path)
+                freed += size
+            except FileNotFoundError:
+                pass
+        if pause and start + batch_size < len(files):
+            time.sleep(pause)
+    for folder in folders:  # Deepest first
+        try:
+            os.rmdir(folder)
+        except OSError:
+            pass  # Not empty: something was written after the scan
+    return freed
+
+def sweep_retention(logger=None, now=None):
+    """Remove expired jobs, then the oldest jobs while over the disk quota. Returns a summary."""
+    if logger is None:
+        logger = logging.getLogger()
+    now = time.time() if now is None else now
+    max_age = app.config['RETENTION_MAX_AGE']
+    quota = app.config['RETENTION_DISK_QUOTA']
+    
+    jobs = collect_job_usage()
+    active = active_job_ids()
+    total_bytes = sum(job['bytes'] for job in jobs.values())
+    remaining = total_bytes
+    victims = []
+    for job_id, job in sorted(jobs.items(), key=lambda item: item[1]['mtime']):
+        if job_id in active or now - job['mtime'] < app.config['RETENTION_GRACE']:
+            continue
+        if (max_age and now - job['mtime'] > max_age) or (quota and remaining > quota):
+            victims.append(job_id)
+            remaining -= job['bytes']
+    
+    removed = []
+    reclaimed = 0
+    for job_id in victims:
+        # The job may have been submitted again since the scan
+        if job_id in active_job_ids():
+            continue
+        reclaimed += delete_in_batches(jobs[job_id]['paths'], max(1, app.config['RETENTION_BATCH_SIZE']))
+        forget_job(job_id)
+        removed.append(job_id)
+        logger.info(f"Retention: removed job {job_id} ({jobs[job_id]['bytes']} bytes)")
+    expired_state = sweep_job_state()
+    
+    summary = {
+        'jobs_scanned': len(jobs),
+        'jobs_removed': len(removed),
+        'bytes_reclaimed': reclaimed,
+        'bytes_in_use': total_bytes - reclaimed,
+        'state_entries_expired': expired_state
+    }
+    logger.info(
+        f"Retention sweep: removed {len(removed)} of {len(jobs)} jobs, reclaimed {reclaimed} bytes, "
+        f"{total_bytes - reclaimed} bytes in use (quota {quota})"
+    )
+    return summary
+
+def _retention_loop():
+    while True:
+        time.sleep(app.config['RETENTION_INTERVAL'])
+        try:
+            sweep_retention(setup_logging())
+        except Exception as e:
+            logging.getLogger().error(f"Retention sweep failed: {e}")
+
+def start_retention_janitor():
+    # Started on first use like the job workers, and not at all with RETENTION_INTERVAL=0
+    with retention_lock:
+        if retention_threads or app.config['RETENTION_INTERVAL'] <= 0:
+            return
+        janitor = threading.Thread(target=_retention_loop, daemon=True)
+        janitor.start()
+        retention_threads.append(janitor)
+
+# Job kind -> handler(job_id, params, logger)
+JOB_HANDLERS = {
+    'highlight': run_highlight_job,
+    'highlight_batch': run_highlight_batch_job,
+    'pf_mismatch': run_pf_mismatch_job
+}
+
+init_job_db()
+
+@app.before_request
+def ensure_job_workers():
+    start_job_workers()
+    start_retention_janitor()
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -322,21 +2386,22 @@ def index():
 def upload_files():
     job_id = str(uuid.uuid4())
     job_progress[job_id] = 0
-    job_status[job_id] = 'processing'
+    # Not an active state: an upload that is never processed expires like a finished job
+    job_status[job_id] = 'uploaded'
     
     excel_file = request.files.get('excel')
-    pdf_file = request.files.get('pdf')
+    # Several PDFs make a batch job: the roster is highlighted in each of them
+    pdf_files = [f for f in request.files.getlist('pdf') if f.filename]
     
-    if not excel_file or not pdf_file:
+    if not excel_file or not pdf_files:
         job_status[job_id] = 'error'
         return jsonify({'job_id': job_id, 'status': 'error', 'message': 'Both Excel and PDF files are required'})
     
-    if not (allowed_file(excel_file.filename, {'xlsx'}) and allowed_file(pdf_file.filename, {'pdf'})):
+    if not (allowed_file(excel_file.filename, {'xlsx'}) and all(allowed_file(f.filename, {'pdf'}) for f in pdf_files)):
         job_status[job_id] = 'error'
         return jsonify({'job_id': job_id, 'status': 'error', 'message': 'Invalid file types'})
     
     excel_filename = secure_filename(excel_file.filename)
-    pdf_filename = secure_filename(pdf_file.filename)
     
     job_folder = os.path.join(app.config['UPLOAD_FOLDER'], job_id)
     output_folder = os.path.join(BASE_PATH, OUTPUT_FOLDER, job_id)
@@ -344,15 +2409,24 @@ def upload_files():
     os.makedirs(output_folder, exist_ok=True)
     
     excel_path = os.path.join(job_folder, excel_filename)
-    pdf_path = os.path.join(job_folder, pdf_filename)
-    
-    excel_file.save(excel_path)
-    pdf_file.save(pdf_path)
+    hashes = {}
+    with job_span(job_id, 'upload_save', upload=True):
+        excel_file.save(excel_path)
+        for pdf_file in pdf_files:
+            stem = os.path.splitext(secure_filename(pdf_file.filename))[0] or 'document'
+            pdf_filename = f"{stem}.pdf"
+            suffix = 1
+            while pdf_filename in hashes:
+                suffix += 1
+                pdf_filename = f"{stem}_{suffix}.pdf"
+            hashes[pdf_filename] = save_upload_with_hash(pdf_file, os.path.join(job_folder, pdf_filename))
+    # A single hash for one PDF, or a dict of file name -> hash for a batch
+    pdf_hashes[job_id] = next(iter(hashes.values())) if len(hashes) == 1 else hashes
     
     try:
-        df = pd.read_excel(excel_path)
-        columns = df.columns.tolist()
-        return jsonify({'job_id': job_id, 'status': 'columns', 'columns': columns})
+        with job_span(job_id, 'excel_parse', upload=True):
+            columns = get_roster_header(job_id, excel_path)
+        return jsonify({'job_id': job_id, 'status': 'columns', 'columns': columns, 'pdfs': list(hashes)})
     except Exception as e:
         job_status[job_id] = 'error'
         return jsonify({'job_id': job_id, 'status': 'error', 'message': f'Error reading Excel: {str(e)}'})
@@ -369,53 +2443,67 @@ def process_files():
     highlight_mode = data.get('highlight_mode', 'border')
     color = data.get('color', 'red')
     opacity = float(data.get('opacity', '0.25'))
+    flatten = data.get('output_style', 'annotations') == 'flattened'
+    save_profile = data.get('save_profile', app.config['SAVE_PROFILE'])
+    lazy = data.get('render_mode', 'eager') == 'lazy'
     
     job_folder = os.path.join(app.config['UPLOAD_FOLDER'], job_id)
     output_folder = os.path.join(BASE_PATH, OUTPUT_FOLDER, job_id)
     
     excel_path = next((os.path.join(job_folder, f) for f in os.listdir(job_folder) if f.endswith('.xlsx')), None)
-    pdf_path = next((os.path.join(job_folder, f) for f in os.listdir(job_folder) if f.endswith('.pdf')), None)
+    pdf_paths = sorted(os.path.join(job_folder, f) for f in os.listdir(job_folder) if f.endswith('.pdf'))
     
-    if not excel_path or not pdf_path:
+    if not excel_path or not pdf_paths:
         job_status[job_id] = 'error'
         return jsonify({'status': 'error', 'message': 'Files not found'})
     
-    if not site_column or (highlight_type == 'uan' and not uan_column) or (highlight_type == 'esic' and not esic_column):
+    if highlight_type not in HIGHLIGHT_TYPES and highlight_type != 'both':
+        return jsonify({'status': 'error', 'message': f'Unknown highlight type: {highlight_type}'})
+    
+    if (
+        not site_column or
+        (highlight_type in ('uan', 'both') and not uan_column) or
+        (highlight_type in ('esic', 'both') and not esic_column)
+    ):
         job_status[job_id] = 'error'
         return jsonify({'status': 'error', 'message': 'Required columns not selected'})
     
-    def parse_color(color_str):
-        color_str = color_str.lower()
-        colors = {
-            'red': (1, 0, 0, 1),
-            'blue': (0, 0, 1, 1),
-            'green': (0, 0.5, 0, 1),
-            'black': (0, 0, 0, 1),
-            'orange': (1, 0.5, 0, 1),
-            'yellow': (1, 0.9, 0, 1)
-        }
-        return colors.get(color_str, (1, 0, 0, 1))
+    if save_profile not in SAVE_PROFILES:
+        return jsonify({'status': 'error', 'message': f'Unknown save profile: {save_profile}'})
     
-    logger = setup_logging()
+    try:
+        # A batch processes its PDFs in parallel unless the client sends workers
+        default_workers = len(pdf_paths) if len(pdf_paths) > 1 else app.config['HIGHLIGHT_WORKERS']
+        workers, priority = parse_job_options(data, default_workers)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'workers and priority must be integers'})
     
-    def run_processing():
-        highlight_uans_by_site(
-            job_id=job_id,
-            excel_path=excel_path,
-            pdf_path=pdf_path,
-            output_dir=output_folder,
-            highlight_type=highlight_type,
-            uan_column=uan_column,
-            esic_column=esic_column,
-            site_column=site_column,
-            border_color=parse_color(color),
-            highlight_mode=highlight_mode,
-            highlight_opacity=opacity,
-            logger=logger
-        )
+    if lazy and len(pdf_paths) > 1:
+        return jsonify({'status': 'error', 'message': 'Rendering on first download is not available for several PDFs'})
+    
+    kind, params = highlight_job_params(
+        excel_path,
+        pdf_paths,
+        output_folder,
+        pdf_hashes=pdf_hashes.get(job_id),
+        lazy=lazy,
+        highlight_type=highlight_type,
+        uan_column=uan_column,
+        esic_column=esic_column,
+        site_column=site_column,
+        border_color=parse_color(color),
+        highlight_mode=highlight_mode,
+        highlight_opacity=opacity,
+        workers=workers,
+        flatten=flatten,
+        save_profile=save_profile
+    )
     
-    threading.Thread(target=run_processing, daemon=True).start()
-    return jsonify({'status': 'processing', 'job_id': job_id})
+    # Re-processing an upload (e.g. with another column choice) starts from scratch
+    job_stats.pop(job_id, None)
+    if not submit_job(job_id, kind, params, priority=priority):
+        return jsonify({'status': 'error', 'message': 'This job is already queued or running'})
+    return jsonify({'status': 'processing', 'job_id': job_id, 'queue_position': get_queue_position(job_id)})
 
 @app.route('/pf_upload', methods=['POST'])
 @login_required
@@ -426,6 +2514,15 @@ def pf_upload():
     if not file or not allowed_file(file.filename, {'pdf'}):
         return jsonify({'status': 'error', 'message': 'Please upload a valid PDF file'})
     
+    engine = request.form.get('engine', app.config['PF_EXTRACT_ENGINE'])
+    if engine not in ECR_EXTRACTION_ENGINES:
+        return jsonify({'status': 'error', 'message': f'Unknown extraction engine: {engine}'})
+    
+    try:
+        workers, priority = parse_job_options(request.form, app.config['PF_EXTRACT_WORKERS'])
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'workers and priority must be integers'})
+    
     filename = secure_filename(file.filename)
     base_filename = os.path.splitext(filename)[0]
     output_filename = f"{base_filename}_name_mismatch.xlsx"
@@ -437,73 +2534,102 @@ def pf_upload():
     
     file_path = os.path.join(job_folder, filename)
     output_path = os.path.join(output_folder, output_filename)
-    file.save(file_path)
+    with job_span(job_id, 'upload_save', upload=True):
+        file.save(file_path)
     
+    params = {'pdf_path': file_path, 'output_path': output_path, 'workers': workers, 'engine': engine}
+    submit_job(job_id, 'pf_mismatch', params, priority=priority)
+    pf_output_files[job_id] = output_filename
+    return jsonify({'status': 'processing', 'job_id': job_id, 'queue_position': get_queue_position(job_id)})
+
+def get_pf_output_filename(job_id):
+    # Known in memory for jobs submitted since the last restart, otherwise from the queue record
+    if job_id in pf_output_files:
+        return pf_output_files[job_id]
+    record = get_job_record(job_id)
+    if record is None or record['kind'] != 'pf_mismatch':
+        return None
+    return os.path.basename(json.loads(record['params'])['output_path'])
+
+@app.route('/pf_results/<job_id>')
+@login_required
+def pf_results(job_id):
+    logger = setup_logging()
     try:
-        data = []
-        with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages[1:-1]:  # Skip first and last page
-                table = page.extract_table()
-                if table:
-                    for row in table[1:]:  # Skip header row
-                        selected_row = [row[0], row[1], row[2], row[3]]
-                        data.append(selected_row)
-        
-        columns = ["Sl. No", "UAN", "ECR", "UAN Repository"]
-        df = pd.DataFrame(data, columns=columns)
-        df = df[df['Sl. No'].notna() & (df['Sl. No'] != 'None')].reset_index(drop=True)
-        
-        df['ECR_clean'] = df['ECR'].apply(clean_name)
-        df['UAN_Repository_clean'] = df['UAN Repository'].apply(clean_name)
-        df['ECR_middle'] = df['ECR_clean'].apply(get_middle_two_chars)
-        df['UAN_Repository_middle'] = df['UAN_Repository_clean'].apply(get_middle_two_chars)
-        
-        df['Highlight'] = (
-            (df['ECR_clean'].str[:4] == df['UAN_Repository_clean'].str[:4]) &
-            (df['ECR_clean'].str[-4:] == df['UAN_Repository_clean'].str[-4:]) &
-            (df['ECR_middle'] == df['UAN_Repository_middle'])
-        )
+        try:
+            offset = max(0, int(request.args.get('offset', 0)))
+            limit = min(max(1, int(request.args.get('limit', PF_RESULTS_PAGE_SIZE))), PF_RESULTS_MAX_PAGE_SIZE)
+        except ValueError:
+            return jsonify({'status': 'error', 'message': 'offset and limit must be integers'})
+        sort = request.args.get('sort') or None
+        order = request.args.get('order', 'asc')
+        if sort is not None and sort not in PF_COLUMNS:
+            return jsonify({'status': 'error', 'message': f'Cannot sort by: {sort}'})
+        if order not in ('asc', 'desc'):
+            return jsonify({'status': 'error', 'message': f'Unknown sort order: {order}'})
         
-        df['ECR'] = df['ECR'].apply(clean_name_display)
-        df['UAN Repository'] = df['UAN Repository'].apply(clean_name_display)
-        df['ECR'] = df['ECR'].str.replace(' ', '', regex=False)
-        df['UAN Repository'] = df['UAN Repository'].str.replace(' ', '', regex=False)
+        status = job_status.get(job_id)
+        if status is None:
+            record = get_job_record(job_id)
+            if record is None:
+                return jsonify({'status': 'error', 'message': 'No results found'})
+            status = record['status']
+        if status != 'completed':
+            response = {'status': status, 'progress': job_progress.get(job_id, 0)}
+            if status == 'error':
+                response['message'] = 'Error processing PDF'
+            elif status == 'cancelled':
+                response['message'] = 'Processing was cancelled'
+            return jsonify(response)
         
-        df = df[df['Highlight'] == False]
-        df = df.drop(columns=['ECR_clean', 'UAN_Repository_clean', 'ECR_middle', 'UAN_Repository_middle', 'Highlight'])
+        df = pf_mismatched_data.get(job_id)
+        if df is None:
+            filename = get_pf_output_filename(job_id)
+            filepath = os.path.join(BASE_PATH, OUTPUT_FOLDER, job_id, filename) if filename else None
+            if not filepath or not os.path.exists(filepath):
+                return jsonify({'status': 'error', 'message': 'No mismatches found'})
+            df = pd.read_excel(filepath, dtype=str).fillna('')
+            pf_mismatched_data[job_id] = df
         
         if df.empty:
             return jsonify({'status': 'error', 'message': 'No mismatches found'})
         
-        pf_mismatched_data[job_id] = df
-        pf_output_files[job_id] = output_filename
-        df.to_excel(output_path, index=False)
-        
-        return jsonify({
+        filtered_total, page = query_mismatches(
+            df,
+            offset=offset,
+            limit=limit,
+            sort=sort,
+            order=order,
+            uan=request.args.get('uan'),
+            name=request.args.get('name')
+        )
+        response = {
             'status': 'success',
             'job_id': job_id,
-            'mismatched_data': df.to_dict(orient='records'),
-            'total_mismatches': len(df)
-        })
-    
+            'total_mismatches': len(df),
+            'filtered_total': filtered_total,
+            'offset': offset,
+            'limit': limit,
+            'sort': sort,
+            'order': order,
+            'mismatched_data': page.to_dict(orient='records')
+        }
+        if job_id in job_stats:
+            response['summary'] = job_stats[job_id]
+        return jsonify(response)
     except Exception as e:
-        logger = setup_logging()
-        logger.error(f"Error in pf_upload: {str(e)}")
-        return jsonify({'status': 'error', 'message': f'Error processing PDF: {str(e)}'})
+        logger.error(f"Error in pf_results for job_id {job_id}: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'Error retrieving results: {str(e)}'})
 
 @app.route('/pf_download/<job_id>')
 @login_required
 def pf_download(job_id):
     logger = setup_logging()
     try:
-        if job_id not in pf_output_files:
-            logger.error(f"No output file found for job_id: {job_id}")
-            return jsonify({'status': 'error', 'message': 'No file available for download'})
-        
         output_folder = os.path.join(BASE_PATH, OUTPUT_FOLDER, job_id)
-        filename = pf_output_files.get(job_id)
+        filename = get_pf_output_filename(job_id)
         if not filename:
-            logger.error(f"Filename not found in pf_output_files for job_id: {job_id}")
+            logger.error(f"No output file found for job_id: {job_id}")
             return jsonify({'status': 'error', 'message': 'No file available for download'})
         
         filepath = os.path.join(output_folder, filename)
@@ -525,13 +2651,16 @@ def pf_refresh(job_id):
         job_folder = os.path.join(app.config['UPLOAD_FOLDER'], job_id)
         output_folder = os.path.join(BASE_PATH, OUTPUT_FOLDER, job_id)
         
+        # Stop the job first so it does not write into the folders removed below
+        if not cancel_job(job_id, wait=True):
+            return jsonify({'status': 'error', 'message': 'Job did not stop in time, try again'})
+        
         for folder in [job_folder, output_folder]:
             if os.path.exists(folder):
                 shutil.rmtree(folder)
                 logger.info(f"Deleted folder: {folder}")
         
-        pf_mismatched_data.pop(job_id, None)
-        pf_output_files.pop(job_id, None)
+        forget_job(job_id)
         
         logger.info(f"Cleaned up job_id: {job_id}")
         return jsonify({'status': 'cleaned'})
@@ -543,8 +2672,119 @@ def pf_refresh(job_id):
 @login_required
 def get_progress(job_id):
     progress = job_progress.get(job_id, 0)
-    status = job_status.get(job_id, 'processing')
-    return jsonify({'progress': progress, 'status': status})
+    status = job_status.get(job_id)
+    if status is None:
+        # Not seen since the last restart: fall back to the persisted queue record
+        record = get_job_record(job_id)
+        status = record['status'] if record else 'processing'
+        if status == 'completed':
+            progress = 100
+    response = {'progress': progress, 'status': status}
+    if status == 'queued':
+        response['queue_position'] = get_queue_position(job_id)
+    if job_id in job_pages:
+        response.update(job_pages[job_id])
+    if job_id in job_stats:
+        response['stats'] = job_stats[job_id]
+    if job_id in job_spans:
+        response['spans'] = summarize_spans(job_spans[job_id])
+    return jsonify(response)
+
+@app.route('/spans/<job_id>')
+@login_required
+def get_spans(job_id):
+    # Every timed stage of the job, plus the totals per stage
+    spans = job_spans.get(job_id, [])
+    return jsonify({'job_id': job_id, 'spans': spans, 'summary': summarize_spans(spans)})
+
+@app.route('/metrics')
+def metrics():
+    # Scraped with METRICS_TOKEN as a bearer token, or viewed by a logged-in user
+    token = app.config['METRICS_TOKEN']
+    authorized = 'user_id' in session or (
+        token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    )
+    if not authorized:
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    gauges = {'fortune_queue_depth': {(('status', status),): jobs for status, jobs in queue_depth().items()}}
+    return Response(render_metrics(gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/job_state')
+@login_required
+def job_state():
+    # Entry counts and approximate bytes held by each per-job state store
+    stores = {name: store.stats() for name, store in JOB_STATE_STORES.items()}
+    return jsonify({
+        'stores': stores,
+        'total_bytes': sum(stats['bytes'] for stats in stores.values()),
+        'total_spilled_bytes': sum(stats['spilled_bytes'] for stats in stores.values())
+    })
+
+@app.route('/cancel/<job_id>', methods=['POST'])
+@login_required
+def cancel(job_id):
+    # Queued jobs of any kind are cancelled at once; a running PF mismatch job stops
+    # after the page it is reading, a running highlight job after the site it is rendering
+    cancel_job(job_id)
+    status = job_status.get(job_id)
+    if status == 'processing' and job_id in job_cancel_requests:
+        status = 'cancelling'
+    return jsonify({'status': status, 'job_id': job_id})
+
+@app.route('/progress_stream/<job_id>')
+@login_required
+def progress_stream(job_id):
+    # Server-Sent Events: replays the job's events, then pushes new ones as they are
+    # published. Event ids let a reconnecting EventSource resume via Last-Event-ID.
+    try:
+        next_event = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        next_event = 0
+    
+    def format_event(event_id, event, data):
+        return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+    
+    def generate():
+        event_index = next_event
+        last_position = None
+        idle_seconds = 0
+        while True:
+            with job_events_condition:
+                events = job_events.get(job_id, [])
+                if len(events) <= event_index:
+                    job_events_condition.wait(timeout=2)
+                    events = job_events.get(job_id, [])
+                pending = events[event_index:]
+            
+            for event, data in pending:
+                yield format_event(event_index, event, data)
+                event_index += 1
+                if event == 'status':
+                    return
+            
+            status = job_status.get(job_id)
+            if status is None:
+                record = get_job_record(job_id)
+                status = record['status'] if record else None
+            if status == 'queued':
+                position = get_queue_position(job_id)
+                if position != last_position:
+                    last_position = position
+                    yield f"event: progress\ndata: {json.dumps({'progress': 0, 'status': 'queued', 'queue_position': position})}\n\n"
+            elif status in ('completed', 'error', 'cancelled', None) and not pending:
+                # Finished before this stream started, or unknown job
+                yield f"event: status\ndata: {json.dumps({'progress': job_progress.get(job_id, 0), 'status': status or 'error'})}\n\n"
+                return
+            
+            idle_seconds = 0 if pending else idle_seconds + 2
+            if idle_seconds >= 15:
+                idle_seconds = 0
+                yield ": keep-alive\n\n"
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/results/<job_id>')
 @login_required
@@ -556,9 +2796,35 @@ def get_results(job_id):
             logger.error(f"Output folder does not exist: {output_folder}")
             return jsonify({'status': 'error', 'message': 'No results found'})
         
-        files = [f for f in os.listdir(output_folder) if f.endswith('.pdf')]
-        logger.info(f"Found {len(files)} PDF files for job_id: {job_id}")
-        return jsonify({'status': 'completed', 'files': files})
+        sites = job_manifests.get(job_id)
+        if sites is None:
+            sites = read_job_manifest(output_folder)
+        if sites is None:
+            files = [f for f in os.listdir(output_folder) if f.endswith('.pdf')]
+            logger.info(f"Found {len(files)} PDF files for job_id: {job_id}")
+            return jsonify({'status': 'completed', 'files': files})
+        
+        # Manifest-backed results: may be partial while the job is still running
+        status = job_status.get(job_id)
+        if status is None:
+            record = get_job_record(job_id)
+            status = record['status'] if record else 'completed'
+        response = {
+            'status': status if status in ('completed', 'error', 'cancelled') else 'processing',
+            'files': [site['file'] for site in sites],
+            'sites': list(sites)
+        }
+        if status == 'error':
+            response['message'] = (
+                'Processing failed; the files listed were completed before the error' if sites else 'Processing failed'
+            )
+        elif status == 'cancelled':
+            response['message'] = 'Processing was cancelled' + ('; the files listed were completed before it stopped' if sites else '')
+        batch = read_batch_summary(output_folder)
+        if batch is not None:
+            response['batch'] = batch
+        logger.info(f"Manifest lists {len(sites)} PDF files for job_id: {job_id} ({status})")
+        return jsonify(response)
     except Exception as e:
         logger.error(f"Error in get_results for job_id {job_id}: {str(e)}")
         return jsonify({'status': 'error', 'message': f'Error retrieving results: {str(e)}'})
@@ -571,6 +2837,10 @@ def download_file(job_id, filename):
         output_folder = os.path.join(BASE_PATH, OUTPUT_FOLDER, job_id)
         filepath = os.path.join(output_folder, filename)
         
+        if not os.path.exists(filepath) and filename.endswith('.pdf'):
+            # Lazy jobs render a site PDF on its first download
+            filepath = render_lazy_site(job_id, output_folder, filename, logger) or filepath
+        
         if not os.path.exists(filepath):
             logger.error(f"File does not exist: {filepath}")
             return jsonify({'status': 'error', 'message': f'File not found: {filename}'})
@@ -581,42 +2851,85 @@ def download_file(job_id, filename):
         logger.error(f"Error in download_file for job_id {job_id}, filename {filename}: {str(e)}")
         return jsonify({'status': 'error', 'message': f'Error downloading file: {str(e)}'})
 
+# Streaming ZIP: ZipFile writes into a buffer that is drained after every chunk,
+# so the archive goes to the client as it is built, in bounded memory
+class ZipStreamBuffer(io.RawIOBase):
+    def __init__(self):
+        self._chunks = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+    
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def stream_zip(files, compress_type=zipfile.ZIP_STORED, chunk_size=64 * 1024, logger=None):
+    """Yield a ZIP archive of (path, arcname) pairs chunk by chunk, without a temporary file."""
+    if logger is None:
+        logger = logging.getLogger()
+    buffer = ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=compress_type) as zipf:
+        for file_path, arcname in files:
+            info = zipfile.ZipInfo.from_file(file_path, arcname)
+            info.compress_type = compress_type
+            # ZIP64 must be decided up front when the output is not seekable
+            force_zip64 = info.file_size > zipfile.ZIP64_LIMIT * 0.9
+            with open(file_path, 'rb') as src, zipf.open(info, 'w', force_zip64=force_zip64) as dest:
+                for chunk in iter(lambda: src.read(chunk_size), b''):
+                    dest.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            logger.info(f"Added to ZIP: {file_path}")
+            data = buffer.drain()
+            if data:
+                yield data
+    # Central directory, written when the ZipFile closes
+    data = buffer.drain()
+    if data:
+        yield data
+
 @app.route('/download_zip/<job_id>')
 @login_required
 def download_zip(job_id):
     logger = setup_logging()
     try:
         output_folder = os.path.join(BASE_PATH, OUTPUT_FOLDER, job_id)
-        zip_path = os.path.join(BASE_PATH, OUTPUT_FOLDER, f"{job_id}.zip")
         
         if not os.path.exists(output_folder):
             logger.error(f"Output folder does not exist: {output_folder}")
             return jsonify({'status': 'error', 'message': 'No files available for download'})
         
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, _, files in os.walk(output_folder):
-                for file in files:
+        if read_lazy_plan(output_folder) is not None:
+            # Lazy job: sites not downloaded yet are rendered as the archive reaches them
+            files = iter_lazy_outputs(job_id, output_folder, logger)
+        else:
+            files = []
+            for root, _, filenames in os.walk(output_folder):
+                for file in sorted(filenames):
                     if file.endswith('.pdf'):
                         file_path = os.path.join(root, file)
-                        zipf.write(file_path, os.path.relpath(file_path, output_folder))
-                        logger.info(f"Added to ZIP: {file_path}")
+                        files.append((file_path, os.path.relpath(file_path, output_folder)))
         
-        if not os.path.exists(zip_path):
-            logger.error(f"ZIP file was not created: {zip_path}")
-            return jsonify({'status': 'error', 'message': 'Failed to create ZIP file'})
-        
-        logger.info(f"Serving ZIP file: {zip_path}")
-        return send_file(zip_path, as_attachment=True, download_name=f"highlighted_pdfs_{job_id}.zip")
+        # Site PDFs are already deflated, so entries are stored unless ?compress=deflate
+        compress_type = zipfile.ZIP_DEFLATED if request.args.get('compress') == 'deflate' else zipfile.ZIP_STORED
+        logger.info(f"Streaming ZIP for job_id: {job_id}")
+        response = Response(
+            stream_with_context(stream_zip(files, compress_type=compress_type, logger=logger)),
+            mimetype='application/zip'
+        )
+        response.headers['Content-Disposition'] = f'attachment; filename="highlighted_pdfs_{job_id}.zip"'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
     except Exception as e:
         logger.error(f"Error in download_zip for job_id {job_id}: {str(e)}")
         return jsonify({'status': 'error', 'message': f'Error creating ZIP file: {str(e)}'})
-    finally:
-        if os.path.exists(zip_path):
-            try:
-                os.remove(zip_path)
-                logger.info(f"Deleted temporary ZIP file: {zip_path}")
-            except Exception as e:
-                logger.error(f"Error deleting temporary ZIP file {zip_path}: {str(e)}")
 
 @app.route('/cleanup/<job_id>')
 @login_required
@@ -627,6 +2940,11 @@ def cleanup(job_id):
         output_folder = os.path.join(BASE_PATH, OUTPUT_FOLDER, job_id)
         zip_path = os.path.join(BASE_PATH, OUTPUT_FOLDER, f"{job_id}.zip")
         
+        # Stop the job and any lazy renders first so they do not write into the folders removed below
+        if not cancel_job(job_id, wait=True):
+            return jsonify({'status': 'error', 'message': 'Job did not stop in time, try again'})
+        wait_for_lazy_renders(job_id)
+        
         for folder in [job_folder, output_folder]:
             if os.path.exists(folder):
                 shutil.rmtree(folder)
@@ -636,8 +2954,7 @@ def cleanup(job_id):
             os.remove(zip_path)
             logger.info(f"Deleted ZIP file: {zip_path}")
         
-        job_progress.pop(job_id, None)
-        job_status.pop(job_id, None)
+        forget_job(job_id)
         
         logger.info(f"Cleaned up job_id: {job_id}")
         return jsonify({'status': 'cleaned'})
@@ -646,6 +2963,10 @@ def cleanup(job_id):
         return jsonify({'status': 'error', 'message': f'Error cleaning up: {str(e)}'})
 
 if __name__ == '__main__':
+    # Required for the site rendering process pool in the PyInstaller build
+    multiprocessing.freeze_support()
+    start_job_workers()
+    start_retention_janitor()
     # Automatically open the browser when running the app
     import webbrowser
     webbrowser.open('http://localhost:5000')
@@ -0,0 +1,73 @@
+"""Benchmark UAN highlighting speed against the number of worker processes.
+
+Run from the fortune_automation_tools folder:
+
+    python -m benchmarks.bench_highlight_workers --members 6000 --sites 40 --workers 1 2 4 8
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+import app
+from benchmarks.synthetic import make_members, make_ecr_pdf, make_roster
+
+def _output_digests(output_dir):
+    # The trailer /ID is random per save, so compare the PDF objects rather than raw bytes
+    digests = {}
+    for name in sorted(os.listdir(output_dir)):
+        if not name.endswith('.pdf'):
+            continue
+        doc = fitz.open(os.path.join(output_dir, name))
+        objects = ''.join(doc.xref_object(xref) for xref in range(1, doc.xref_length()))
+        digests[name] = hashlib.md5(objects.encode()).hexdigest()
+        doc.close()
+    return digests
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--members', type=int, default=6000)
+    parser.add_argument('--rows-per-page', type=int, default=40)
+    parser.add_argument('--sites', type=int, default=40)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, 'ecr.pdf')
+        excel_path = os.path.join(tmp, 'roster.xlsx')
+        members = make_members(args.members, seed=args.seed)
+        pages = make_ecr_pdf(pdf_path, members, rows_per_page=args.rows_per_page, seed=args.seed)
+        make_roster(excel_path, members, sites=args.sites, seed=args.seed)
+        print(f"{args.members} members, {pages} pages, {args.sites} sites, {os.cpu_count()} CPUs")
+        print(f"{'workers':>8} {'seconds':>9} {'speedup':>8} {'identical':>10}")
+
+        baseline_seconds = None
+        baseline_digests = None
+        for workers in args.workers:
+            output_dir = os.path.join(tmp, f'out_{workers}')
+            start = time.perf_counter()
+            ok = app.highlight_uans_by_site(
+                job_id=f'bench-{workers}',
+                excel_path=excel_path,
+                pdf_path=pdf_path,
+                output_dir=output_dir,
+                highlight_type='uan',
+                uan_column='UAN No',
+                esic_column='ESIC No',
+                site_column='Site Name',
+                workers=workers
+            )
+            seconds = time.perf_counter() - start
+            if not ok:
+                raise SystemExit(f"highlight_uans_by_site failed with {workers} workers")
+            digests = _output_digests(output_dir)
+            if baseline_seconds is None:
+                baseline_seconds, baseline_digests = seconds, digests
+            print(f"{workers:>8} {seconds:>9.2f} {baseline_seconds / seconds:>7.2f}x {str(digests == baseline_digests):>10}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Benchmark the PF name mismatch check: per-row apply versus the vectorised kernel.
+
+Compares the Series.apply version of the check that find_name_mismatches used
+before with app.find_name_mismatches. The rows include the edge cases the rule
+has to keep: missing and non-string cells, short names, wrapped names and
+unusual whitespace. Run from the fortune_automation_tools folder:
+
+    python -m benchmarks.bench_name_compare --rows 200000
+"""
+import argparse
+import random
+import sys
+import time
+
+import pandas as pd
+
+import app
+from benchmarks.synthetic import FIRST_NAMES, LAST_NAMES
+
+def legacy_find_name_mismatches(data):
+    # find_name_mismatches before the vectorised kernel
+    df = pd.DataFrame(data, columns=app.PF_COLUMNS)
+    df = df[df['Sl. No'].notna() & (df['Sl. No'] != 'None')].reset_index(drop=True)
+
+    df['ECR_clean'] = df['ECR'].apply(app.clean_name)
+    df['UAN_Repository_clean'] = df['UAN Repository'].apply(app.clean_name)
+    df['ECR_middle'] = df['ECR_clean'].apply(app.get_middle_two_chars)
+    df['UAN_Repository_middle'] = df['UAN_Repository_clean'].apply(app.get_middle_two_chars)
+
+    df['Highlight'] = (
+        (df['ECR_clean'].str[:4] == df['UAN_Repository_clean'].str[:4]) &
+        (df['ECR_clean'].str[-4:] == df['UAN_Repository_clean'].str[-4:]) &
+        (df['ECR_middle'] == df['UAN_Repository_middle'])
+    )
+
+    df['ECR'] = df['ECR'].apply(app.clean_name_display)
+    df['UAN Repository'] = df['UAN Repository'].apply(app.clean_name_display)
+    df['ECR'] = df['ECR'].str.replace(' ', '', regex=False)
+    df['UAN Repository'] = df['UAN Repository'].str.replace(' ', '', regex=False)
+
+    df = df[df['Highlight'] == False]
+    return df.drop(columns=['ECR_clean', 'UAN_Repository_clean', 'ECR_middle', 'UAN_Repository_middle', 'Highlight'])
+
+EDGE_NAMES = [None, '', ' ', 'A', 'Ab', 'abc', 'ABCD', 'Ram\nPatil', '  RAM   PATIL ', 'RAM\tPATIL',
+              'RAM\xa0PATIL', 'RAM PATIL', 'ÉMILE ÇA', 'İBRAHIM', 'ram patil', 42, 3.5]
+
+def make_rows(count, mismatch_ratio=0.05, edge_ratio=0.02, seed=0):
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(count):
+        name = f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}"
+        repository_name = name
+        if rnd.random() < mismatch_ratio:
+            repository_name = f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}"
+        if rnd.random() < edge_ratio:
+            name = rnd.choice(EDGE_NAMES)
+        if rnd.random() < edge_ratio:
+            repository_name = rnd.choice(EDGE_NAMES)
+        serial = str(i + 1) if rnd.random() > edge_ratio else rnd.choice([None, 'None'])
+        rows.append([serial, str(100000000000 + i), name, repository_name])
+    return rows
+
+def _same_values(left, right):
+    return (
+        list(left.columns) == list(right.columns) and
+        list(left.index) == list(right.index) and
+        left.astype(object).values.tolist() == right.astype(object).values.tolist()
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows, seed=args.seed)
+    print(f"{args.rows} rows, best of {args.repeat}")
+
+    timings = {}
+    results = {}
+    for label, func in (('apply', legacy_find_name_mismatches), ('vectorised', app.find_name_mismatches)):
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            results[label] = func(rows)
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        timings[label] = best
+
+    identical = _same_values(results['apply'], results['vectorised'])
+    print(f"{'apply':>12} {timings['apply']:>8.3f}s")
+    print(f"{'vectorised':>12} {timings['vectorised']:>8.3f}s  {timings['apply'] / timings['vectorised']:.2f}x")
+    print(f"{len(results['vectorised'])} mismatches, identical: {identical}")
+    if not identical:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Compare the PF ECR table extraction engines for correctness and speed.
+
+Every engine in app.ECR_EXTRACTION_ENGINES reads the same ECR. Its Sl. No / UAN /
+ECR / UAN Repository rows and its name mismatch table are checked against the
+first engine listed. The script exits with status 1 if any engine disagrees.
+Run from the fortune_automation_tools folder, on a synthetic ECR or on a real
+one with --pdf:
+
+    python -m benchmarks.bench_pf_engines --members 6000
+    python -m benchmarks.bench_pf_engines --pdf path/to/ecr.pdf
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import app
+from benchmarks.synthetic import make_members, make_ecr_pdf
+
+def _normalized(rows):
+    # Cell text with whitespace collapsed, as the mismatch check compares it
+    return [[app.clean_name_display(cell) for cell in row] for row in rows]
+
+def compare_engines(pdf_path, engines, workers=1):
+    results = []
+    for engine in engines:
+        start = time.perf_counter()
+        rows = app.extract_ecr_rows(pdf_path, workers=workers, engine=engine)
+        seconds = time.perf_counter() - start
+        results.append((engine, seconds, rows, app.find_name_mismatches(rows)))
+
+    _, _, baseline_rows, baseline_mismatches = results[0]
+    report = []
+    for engine, seconds, rows, mismatches in results:
+        report.append({
+            'engine': engine,
+            'seconds': seconds,
+            'rows': len(rows),
+            'identical_rows': rows == baseline_rows,
+            'same_text': _normalized(rows) == _normalized(baseline_rows),
+            'same_mismatches': mismatches.reset_index(drop=True).equals(baseline_mismatches.reset_index(drop=True))
+        })
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pdf', help='ECR PDF to check instead of a synthetic one')
+    parser.add_argument('--members', type=int, default=6000)
+    parser.add_argument('--rows-per-page', type=int, default=40)
+    parser.add_argument('--engines', nargs='+', default=list(app.ECR_EXTRACTION_ENGINES))
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = args.pdf
+        if pdf_path is None:
+            pdf_path = os.path.join(tmp, 'ecr.pdf')
+            make_ecr_pdf(pdf_path, make_members(args.members, seed=args.seed), rows_per_page=args.rows_per_page, seed=args.seed)
+        with app.ECR_EXTRACTION_ENGINES['pdfplumber']['open'](pdf_path) as pdf:
+            table_pages = max(1, len(pdf.pages) - 2)  # The first and last pages are skipped
+        print(f"{pdf_path}: {table_pages} table pages, {args.workers} worker(s)")
+        print(f"{'engine':>12} {'seconds':>9} {'pages/s':>9} {'speedup':>8} {'rows':>7} {'identical':>10} {'same text':>10} {'mismatches':>11}")
+
+        report = compare_engines(pdf_path, args.engines, workers=args.workers)
+        baseline_seconds = report[0]['seconds']
+        for entry in report:
+            print(
+                f"{entry['engine']:>12} {entry['seconds']:>9.2f} {table_pages / entry['seconds']:>9.1f} "
+                f"{baseline_seconds / entry['seconds']:>7.2f}x {entry['rows']:>7} {str(entry['identical_rows']):>10} "
+                f"{str(entry['same_text']):>10} {str(entry['same_mismatches']):>11}"
+            )
+
+    if not all(entry['same_mismatches'] for entry in report):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
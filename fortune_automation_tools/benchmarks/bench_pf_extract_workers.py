@@ -0,0 +1,47 @@
+"""Benchmark PF ECR table extraction speed against the number of worker processes.
+
+Reports pages/second for app.extract_ecr_rows on a synthetic ECR and checks
+that every worker count returns the same rows as the serial read. Run from the
+fortune_automation_tools folder:
+
+    python -m benchmarks.bench_pf_extract_workers --members 6000 --workers 1 2 4 8
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import app
+from benchmarks.synthetic import make_members, make_ecr_pdf
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--members', type=int, default=6000)
+    parser.add_argument('--rows-per-page', type=int, default=40)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, 'ecr.pdf')
+        members = make_members(args.members, seed=args.seed)
+        pages = make_ecr_pdf(pdf_path, members, rows_per_page=args.rows_per_page, seed=args.seed)
+        table_pages = pages - 2  # The cover and summary pages are skipped
+        print(f"{args.members} members, {pages} pages, {os.cpu_count()} CPUs")
+        print(f"{'workers':>8} {'seconds':>9} {'pages/s':>9} {'speedup':>8} {'identical':>10}")
+
+        baseline_seconds = None
+        baseline_rows = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            rows = app.extract_ecr_rows(pdf_path, workers=workers)
+            seconds = time.perf_counter() - start
+            if baseline_seconds is None:
+                baseline_seconds, baseline_rows = seconds, rows
+            print(
+                f"{workers:>8} {seconds:>9.2f} {table_pages / seconds:>9.1f} "
+                f"{baseline_seconds / seconds:>7.2f}x {str(rows == baseline_rows):>10}"
+            )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Micro-benchmark for grouping roster numbers by site.
+
+Compares the old per-site boolean mask + iterrows loop with
+app.group_numbers_by_site. Run from the fortune_automation_tools folder:
+
+    python -m benchmarks.bench_site_grouping --rows 100000 --sites 500
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import app
+
+def legacy_group_numbers_by_site(df, site_column, target_column):
+    # The loop highlight_uans_by_site used before group_numbers_by_site
+    groups = []
+    for site in df[site_column].dropna().unique():
+        site_df = df[df[site_column] == site]
+        number_dict = {}
+        for _, row in site_df.iterrows():
+            number = str(row[target_column]).strip()
+            if not number or number == "nan":
+                continue
+            number_dict[number.replace(" ", "")] = "regular"
+        if number_dict:
+            groups.append((site, list(number_dict)))
+    return groups
+
+def make_roster(rows, sites, seed=0):
+    rng = np.random.default_rng(seed)
+    numbers = rng.integers(10 ** 11, 10 ** 12, size=rows).astype(str)
+    site_names = np.array([f"Site {i:04d}" for i in range(sites)])
+    return pd.DataFrame({
+        'UAN No': numbers,
+        'Site Name': site_names[rng.integers(0, sites, size=rows)]
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--sites', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    df = make_roster(args.rows, args.sites, seed=args.seed)
+    print(f"{args.rows} rows, {args.sites} sites")
+
+    start = time.perf_counter()
+    legacy = legacy_group_numbers_by_site(df, 'Site Name', 'UAN No')
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    grouped = app.group_numbers_by_site(df, 'Site Name', 'UAN No')
+    grouped_seconds = time.perf_counter() - start
+
+    identical = legacy == [(site, numbers.tolist()) for site, numbers in grouped]
+    print(f"mask + iterrows:        {legacy_seconds:8.3f}s")
+    print(f"group_numbers_by_site:  {grouped_seconds:8.3f}s ({legacy_seconds / grouped_seconds:.1f}x faster)")
+    print(f"identical groups:       {identical}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+"""Time every stage of the highlight and PF mismatch pipelines on synthetic data.
+
+Generates an ECR PDF, an ESIC contribution PDF and a matching roster from a seed
+(no network or real payroll data needed), times each stage --repeat times, and
+writes the results with the commit, package versions and dataset sizes to JSON.
+Pass an earlier result file to --compare to see the change per stage. Run from
+the fortune_automation_tools folder:
+
+    python -m benchmarks.run_suite --preset small
+    python -m benchmarks.run_suite --pages 120 --sites 60 --repeat 5 --output after.json --compare before.json
+    python -m benchmarks.run_suite --stages index_build render_sites
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import fitz  # PyMuPDF
+import numpy as np
+import pandas as pd
+import pdfplumber
+
+import app
+from benchmarks.synthetic import make_members, members_for_pages, make_ecr_pdf, make_esic_pdf, make_roster
+
+SUITE_VERSION = 1
+
+# Preset -> dataset size; explicit arguments override the preset
+PRESETS = {
+    'small': {'pages': 10, 'rows_per_page': 40, 'sites': 10},
+    'medium': {'pages': 75, 'rows_per_page': 40, 'sites': 40},
+    'large': {'pages': 300, 'rows_per_page': 40, 'sites': 150}
+}
+
+COLUMNS = {'uan_column': 'UAN No', 'esic_column': 'ESIC No', 'site_column': 'Site Name'}
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'packages': {
+            'pymupdf': fitz.VersionBind,
+            'pdfplumber': pdfplumber.__version__,
+            'pandas': pd.__version__,
+            'numpy': np.__version__
+        }
+    }
+
+class Suite:
+    """Runs named stages on one generated dataset and collects their timings."""
+
+    def __init__(self, data, repeat):
+        self.data = data
+        self.repeat = repeat
+        self.results = {}
+        self._runs = 0
+
+    def job_id(self):
+        self._runs += 1
+        return f"bench-{self._runs}"
+
+    def clear_index_cache(self):
+        cache_folder = app.app.config['INDEX_CACHE_FOLDER']
+        for name in os.listdir(cache_folder) if os.path.isdir(cache_folder) else []:
+            os.remove(os.path.join(cache_folder, name))
+
+    def time_stage(self, name, run, setup=None, pages=None):
+        """Time run() repeat times; run may return a dict of figures to record with the timings."""
+        seconds = []
+        extra = {}
+        for _ in range(self.repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            extra = run() or {}
+            seconds.append(time.perf_counter() - start)
+        median = statistics.median(seconds)
+        result = dict(extra, seconds=round(median, 4), min_seconds=round(min(seconds), 4), runs=[round(s, 4) for s in seconds])
+        if pages:
+            result['pages_per_second'] = round(pages / median, 1)
+        self.results[name] = result
+        print(f"{name:>22} {median:>9.3f}s  {', '.join(f'{k}={v}' for k, v in extra.items())}")
+        return result
+
+def _highlight(suite, pdf_path, highlight_type, output_name):
+    output_dir = os.path.join(suite.data['tmp'], output_name)
+    job_id = suite.job_id()
+    if not app.highlight_uans_by_site(
+        job_id=job_id, excel_path=suite.data['roster'], pdf_path=pdf_path, output_dir=output_dir,
+        highlight_type=highlight_type, **COLUMNS
+    ):
+        raise SystemExit(f"highlight_uans_by_site failed for {highlight_type}")
+    stats = app.job_stats[job_id]
+    app.forget_job(job_id)
+    return {'files': stats['files_written'], 'bytes_written': stats['bytes_written']}
+
+def stage_roster_parse(suite):
+    def run():
+        job_id = suite.job_id()
+        header = app.get_roster_header(job_id, suite.data['roster'])
+        rows = len(app.load_roster_columns(job_id, suite.data['roster'], list(COLUMNS.values())))
+        app.forget_job(job_id)
+        return {'columns': len(header), 'rows': rows}
+    suite.time_stage('roster_parse', run)
+
+def stage_roster_group(suite):
+    job_id = suite.job_id()
+    app.load_roster_columns(job_id, suite.data['roster'], list(COLUMNS.values()))
+
+    def run():
+        groups = app.group_roster_by_site(job_id, suite.data['roster'], 'both', logger=logging.getLogger(), **COLUMNS)
+        return {'site_groups': len(groups)}
+    suite.time_stage('roster_group', run)
+    app.forget_job(job_id)
+
+def stage_index_build(suite):
+    def run():
+        index = app.build_number_index(suite.data['ecr'], lengths=(10, 12))
+        return {'numbers': len(index['numbers'])}
+    suite.time_stage('index_build', run, pages=suite.data['ecr_pages'])
+
+def stage_index_cache_load(suite):
+    pdf_hash = app.file_sha256(suite.data['ecr'])
+    app.load_number_index(suite.data['ecr'], pdf_hash)
+
+    def run():
+        _, hit = app.load_number_index(suite.data['ecr'], pdf_hash)
+        return {'hit': hit}
+    suite.time_stage('index_cache_load', run)
+
+def stage_render_sites(suite):
+    job_id = suite.job_id()
+    logger = logging.getLogger()
+    groups = app.group_roster_by_site(job_id, suite.data['roster'], 'uan', logger=logger, **COLUMNS)
+    app.forget_job(job_id)
+    number_index = app.build_number_index(suite.data['ecr'], lengths=(10, 12))
+    output_dir = os.path.join(suite.data['tmp'], 'render_sites')
+    os.makedirs(output_dir, exist_ok=True)
+
+    def run():
+        source_doc = fitz.open(suite.data['ecr'])
+        results = []
+        for group in groups:
+            results.append(app.process_pdf_for_site(
+                pdf_path=suite.data['ecr'],
+                output_path=os.path.join(output_dir, app.site_output_filename(group)),
+                logger=logger,
+                number_index=number_index,
+                source_doc=source_doc,
+                **group,
+                **app.make_render_options()
+            ))
+        source_doc.close()
+        written = [result for result in results if result]
+        return {'files': len(written), 'bytes_written': sum(result['bytes'] for result in written)}
+    suite.time_stage('render_sites', run)
+
+def stage_highlight_uan(suite):
+    suite.time_stage(
+        'highlight_uan', lambda: _highlight(suite, suite.data['ecr'], 'uan', 'uan'),
+        setup=suite.clear_index_cache, pages=suite.data['ecr_pages']
+    )
+
+def stage_highlight_esic(suite):
+    suite.time_stage(
+        'highlight_esic', lambda: _highlight(suite, suite.data['esic'], 'esic', 'esic'),
+        setup=suite.clear_index_cache, pages=suite.data['esic_pages']
+    )
+
+def stage_highlight_both(suite):
+    suite.time_stage(
+        'highlight_both', lambda: _highlight(suite, suite.data['ecr'], 'both', 'both'),
+        setup=suite.clear_index_cache, pages=suite.data['ecr_pages']
+    )
+
+def stage_pf_extract(suite):
+    for engine in app.ECR_EXTRACTION_ENGINES:
+        def run(engine=engine):
+            suite.data['pf_rows'] = app.extract_ecr_rows(suite.data['ecr'], engine=engine)
+            return {'rows': len(suite.data['pf_rows'])}
+        suite.time_stage(f'pf_extract_{engine}', run, pages=suite.data['ecr_pages'])
+
+def stage_pf_compare(suite):
+    rows = suite.data.get('pf_rows') or app.extract_ecr_rows(suite.data['ecr'], engine='pymupdf')
+
+    def run():
+        suite.data['pf_mismatches'] = app.find_name_mismatches(rows)
+        return {'rows': len(rows), 'mismatches': len(suite.data['pf_mismatches'])}
+    suite.time_stage('pf_compare', run)
+
+def stage_pf_excel_write(suite):
+    mismatches = suite.data.get('pf_mismatches')
+    if mismatches is None:
+        mismatches = app.find_name_mismatches(app.extract_ecr_rows(suite.data['ecr'], engine='pymupdf'))
+    output_path = os.path.join(suite.data['tmp'], 'mismatches.xlsx')
+
+    def run():
+        mismatches.to_excel(output_path, index=False)
+        return {'rows': len(mismatches)}
+    suite.time_stage('pf_excel_write', run)
+
+def stage_pf_job(suite):
+    # The job /pf_upload queues, with the default engine
+    def run():
+        job_id = suite.job_id()
+        params = {
+            'pdf_path': suite.data['ecr'],
+            'output_path': os.path.join(suite.data['tmp'], 'pf_job.xlsx'),
+            'engine': app.app.config['PF_EXTRACT_ENGINE']
+        }
+        app.run_pf_mismatch_job(job_id, params, logging.getLogger())
+        stats = app.job_stats[job_id]
+        app.forget_job(job_id)
+        return {'engine': stats['engine'], 'mismatches': stats['mismatches']}
+    suite.time_stage('pf_job', run, pages=suite.data['ecr_pages'])
+
+# Stage name -> function(suite), run in this order
+STAGES = {
+    'roster_parse': stage_roster_parse,
+    'roster_group': stage_roster_group,
+    'index_build': stage_index_build,
+    'index_cache_load': stage_index_cache_load,
+    'render_sites': stage_render_sites,
+    'highlight_uan': stage_highlight_uan,
+    'highlight_esic': stage_highlight_esic,
+    'highlight_both': stage_highlight_both,
+    'pf_extract': stage_pf_extract,
+    'pf_compare': stage_pf_compare,
+    'pf_excel_write': stage_pf_excel_write,
+    'pf_job': stage_pf_job
+}
+
+def print_comparison(baseline, current):
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} ({baseline.get('created_at')}):")
+    print(f"{'stage':>22} {'before':>9} {'after':>9} {'change':>8}")
+    for name, result in current['stages'].items():
+        before = baseline.get('stages', {}).get(name)
+        if before is None:
+            continue
+        change = result['seconds'] / before['seconds'] - 1 if before['seconds'] else 0
+        print(f"{name:>22} {before['seconds']:>9.3f} {result['seconds']:>9.3f} {change:>+7.1%}")
+    if baseline.get('dataset') != current['dataset']:
+        print("Note: the datasets differ, so the timings are not directly comparable")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small')
+    parser.add_argument('--pages', type=int, help='Table pages in each PDF')
+    parser.add_argument('--rows-per-page', type=int)
+    parser.add_argument('--sites', type=int)
+    parser.add_argument('--split-ratio', type=float, default=0.1, help='Share of numbers written as two text spans')
+    parser.add_argument('--invalid-ratio', type=float, default=0.02, help='Share of roster IDs that are invalid')
+    parser.add_argument('--mismatch-ratio', type=float, default=0.05, help='Share of members whose names differ')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--output', help='Result file (default benchmark_results/<commit>-<time>.json)')
+    parser.add_argument('--compare', help='Earlier result file to compare with')
+    args = parser.parse_args()
+
+    dataset = dict(PRESETS[args.preset])
+    for key in ('pages', 'rows_per_page', 'sites'):
+        if getattr(args, key) is not None:
+            dataset[key] = getattr(args, key)
+    dataset.update(
+        split_ratio=args.split_ratio,
+        invalid_ratio=args.invalid_ratio,
+        mismatch_ratio=args.mismatch_ratio,
+        seed=args.seed
+    )
+    dataset['members'] = members_for_pages(dataset['pages'], dataset['rows_per_page'])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep the suite's number indexes out of the app's cache
+        app.app.config['INDEX_CACHE_FOLDER'] = os.path.join(tmp, 'number_index')
+        members = make_members(dataset['members'], mismatch_ratio=args.mismatch_ratio, seed=args.seed)
+        data = {'tmp': tmp, 'ecr': os.path.join(tmp, 'ecr.pdf'), 'esic': os.path.join(tmp, 'esic.pdf'), 'roster': os.path.join(tmp, 'roster.xlsx')}
+        data['ecr_pages'] = make_ecr_pdf(data['ecr'], members, dataset['rows_per_page'], args.split_ratio, args.seed)
+        data['esic_pages'] = make_esic_pdf(data['esic'], members, dataset['rows_per_page'], args.split_ratio, args.seed)
+        make_roster(data['roster'], members, sites=dataset['sites'], invalid_ratio=args.invalid_ratio, seed=args.seed, **COLUMNS)
+        print(
+            f"{dataset['members']} members, {data['ecr_pages']} ECR / {data['esic_pages']} ESIC pages, "
+            f"{dataset['sites']} sites, median of {args.repeat} runs per stage"
+        )
+
+        suite = Suite(data, max(1, args.repeat))
+        for name in args.stages:
+            STAGES[name](suite)
+
+    commit = _git_commit()
+    created_at = datetime.now()
+    report = {
+        'suite_version': SUITE_VERSION,
+        'created_at': created_at.isoformat(timespec='seconds'),
+        'commit': commit,
+        'environment': _environment(),
+        'dataset': dataset,
+        'repeat': args.repeat,
+        'stages': suite.results
+    }
+    output = args.output or os.path.join(
+        'benchmark_results', f"{commit or 'nocommit'}-{created_at.strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), report)
+
+if __name__ == '__main__':
+    sys.exit(main())
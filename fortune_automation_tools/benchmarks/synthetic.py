@@ -0,0 +1,160 @@
+"""Synthetic EPFO ECR / ESIC contribution PDFs and Excel rosters for the benchmarks.
+
+Everything is generated locally from a seed, so benchmark runs are
+reproducible and need no real payroll data.
+"""
+import random
+
+import fitz  # PyMuPDF
+import pandas as pd
+
+ECR_COLUMNS = ["Sl. No", "UAN", "Name as per ECR", "Name as per UAN Repository", "IP Number"]
+COLUMN_WIDTHS = [40, 85, 160, 160, 75]
+ESIC_COLUMNS = ["Sl. No", "IP Number", "IP Name", "No. of Days", "Total Wages", "IP Contribution"]
+ESIC_COLUMN_WIDTHS = [40, 75, 170, 60, 85, 85]
+ROW_HEIGHT = 16
+FONT_SIZE = 7
+LEFT_MARGIN = 30
+TOP_MARGIN = 60
+
+FIRST_NAMES = ["RAMESH", "SURESH", "ANITA", "PRIYA", "MAHESH", "KAVITA", "SANJAY", "DEEPA", "VIJAY", "LATA"]
+LAST_NAMES = ["PATIL", "SHARMA", "GUJAR", "JADHAV", "KULKARNI", "DESAI", "PAWAR", "MORE", "SHINDE", "NAIK"]
+
+def make_members(count, mismatch_ratio=0.05, seed=0):
+    """Return `count` members with unique UAN/ESIC numbers and ECR/repository names."""
+    rnd = random.Random(seed)
+    uans = rnd.sample(range(10 ** 11, 10 ** 12), count)
+    esics = rnd.sample(range(10 ** 9, 10 ** 10), count)
+    members = []
+    for uan, esic in zip(uans, esics):
+        name = f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}"
+        repository_name = name
+        if rnd.random() < mismatch_ratio:
+            repository_name = f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}"
+        members.append({
+            'uan': str(uan),
+            'esic': str(esic),
+            'name_ecr': name,
+            'name_repository': repository_name
+        })
+    return members
+
+def members_for_pages(pages, rows_per_page=40):
+    # Member count whose tables fill `pages` table pages
+    return max(1, pages) * rows_per_page
+
+def _insert_number(page, point, number, split):
+    # Split numbers are written as two text runs in different fonts, which PyMuPDF
+    # reports as two spans of the same line (as seen in some ECR exports)
+    if not split:
+        page.insert_text(point, number, fontsize=FONT_SIZE)
+        return
+    head, tail = number[:len(number) // 2], number[len(number) // 2:]
+    page.insert_text(point, head, fontsize=FONT_SIZE)
+    offset = fitz.get_text_length(head, fontsize=FONT_SIZE)
+    page.insert_text((point[0] + offset, point[1]), tail, fontsize=FONT_SIZE, fontname="cour")
+
+def _draw_row(page, top, values, split_columns=(), widths=COLUMN_WIDTHS):
+    x = LEFT_MARGIN
+    for col, (value, width) in enumerate(zip(values, widths)):
+        page.draw_rect(fitz.Rect(x, top, x + width, top + ROW_HEIGHT), color=(0, 0, 0), width=0.5)
+        point = (x + 3, top + ROW_HEIGHT - 5)
+        if col in split_columns:
+            _insert_number(page, point, value, split=True)
+        else:
+            page.insert_text(point, value, fontsize=FONT_SIZE)
+        x += width
+
+def make_ecr_pdf(path, members, rows_per_page=40, split_ratio=0.1, seed=0):
+    """Write an ECR-style PDF: a cover page, ruled member tables, and a summary page.
+
+    `split_ratio` is the share of UAN/ESIC cells written as two spans.
+    Returns the number of pages written.
+    """
+    rnd = random.Random(seed)
+    doc = fitz.open()
+    cover = doc.new_page()
+    cover.insert_text((LEFT_MARGIN, TOP_MARGIN), "ELECTRONIC CHALLAN CUM RETURN (ECR)", fontsize=12)
+    cover.insert_text((LEFT_MARGIN, TOP_MARGIN + 20), f"Total members: {len(members)}", fontsize=9)
+    
+    for start in range(0, len(members), rows_per_page):
+        page = doc.new_page()
+        _draw_row(page, TOP_MARGIN, ECR_COLUMNS)
+        for offset, member in enumerate(members[start:start + rows_per_page]):
+            top = TOP_MARGIN + ROW_HEIGHT * (offset + 1)
+            values = [
+                str(start + offset + 1),
+                member['uan'],
+                member['name_ecr'],
+                member['name_repository'],
+                member['esic']
+            ]
+            split_columns = (1, 4) if rnd.random() < split_ratio else ()
+            _draw_row(page, top, values, split_columns)
+    
+    summary = doc.new_page()
+    summary.insert_text((LEFT_MARGIN, TOP_MARGIN), "SUMMARY", fontsize=12)
+    page_count = len(doc)
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+    return page_count
+
+def make_esic_pdf(path, members, rows_per_page=40, split_ratio=0.1, seed=0):
+    """Write an ESIC monthly contribution statement: a header page, ruled IP tables, and a totals page.
+
+    `split_ratio` is the share of IP Number cells written as two spans.
+    Returns the number of pages written.
+    """
+    rnd = random.Random(seed)
+    doc = fitz.open()
+    cover = doc.new_page()
+    cover.insert_text((LEFT_MARGIN, TOP_MARGIN), "MONTHLY CONTRIBUTION DETAILS (ESIC)", fontsize=12)
+    cover.insert_text((LEFT_MARGIN, TOP_MARGIN + 20), f"Total IPs: {len(members)}", fontsize=9)
+    
+    for start in range(0, len(members), rows_per_page):
+        page = doc.new_page()
+        _draw_row(page, TOP_MARGIN, ESIC_COLUMNS, widths=ESIC_COLUMN_WIDTHS)
+        for offset, member in enumerate(members[start:start + rows_per_page]):
+            top = TOP_MARGIN + ROW_HEIGHT * (offset + 1)
+            days = rnd.randint(1, 31)
+            wages = days * rnd.randint(400, 900)
+            values = [
+                str(start + offset + 1),
+                member['esic'],
+                member['name_ecr'],
+                str(days),
+                f"{wages:.2f}",
+                f"{wages * 0.0075:.2f}"
+            ]
+            split_columns = (1,) if rnd.random() < split_ratio else ()
+            _draw_row(page, top, values, split_columns, widths=ESIC_COLUMN_WIDTHS)
+    
+    totals = doc.new_page()
+    totals.insert_text((LEFT_MARGIN, TOP_MARGIN), "TOTAL CONTRIBUTION", fontsize=12)
+    page_count = len(doc)
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+    return page_count
+
+def make_roster(path, members, sites=10, invalid_ratio=0.02, seed=0,
+                uan_column='UAN No', esic_column='ESIC No', site_column='Site Name'):
+    """Write an Excel roster assigning members to sites, with some invalid IDs mixed in."""
+    rnd = random.Random(seed)
+    invalid_values = [0, None, 'NA', '12345', 'abc']
+    rows = []
+    for member in members:
+        uan = int(member['uan'])
+        esic = int(member['esic'])
+        if rnd.random() < invalid_ratio:
+            uan = rnd.choice(invalid_values)
+        if rnd.random() < invalid_ratio:
+            esic = rnd.choice(invalid_values)
+        rows.append({
+            'Employee Name': member['name_ecr'],
+            uan_column: uan,
+            esic_column: esic,
+            site_column: f"Site {rnd.randrange(sites):03d}"
+        })
+    df = pd.DataFrame(rows)
+    df.to_excel(path, index=False)
+    return df
@@ -0,0 +1,225 @@
+"""Run the highlight and PF mismatch jobs from the command line, without the web app.
+
+Each run goes through the same job handlers as the queue behind /process and
+/pf_upload, so the outputs match what the browser would produce. A JSON run report
+with the status, timings, statistics, output files and errors of every run is
+written next to the outputs. Run from the fortune_automation_tools folder:
+
+    # Each input folder holds one roster (.xlsx) and one or more PDFs; a folder
+    # without a roster is searched for subfolders that have one
+    python cli.py highlight month_end/ --type both --uan-column "UAN No" \\
+        --esic-column "ESIC No" --site-column "Site Name" --workers 4 --output runs/
+
+    # PF ECR PDFs, given as files or folders
+    python cli.py pf ecr/ --engine pymupdf --workers 4 --output runs/
+
+The exit status is 0 if every run completed and 1 otherwise.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import app
+
+REPORT_FILENAME = 'run_report.json'
+
+class ErrorCollector(logging.Handler):
+    # Keeps the error messages logged during a run for its report entry
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+def find_highlight_inputs(paths):
+    """Return (folder, roster_path, pdf_paths, error) for every input folder."""
+    inputs = []
+    for path in paths:
+        folders = [path]
+        if os.path.isdir(path) and not any(name.endswith('.xlsx') for name in os.listdir(path)):
+            folders = [entry.path for entry in sorted(os.scandir(path), key=lambda e: e.name) if entry.is_dir()]
+        for folder in folders:
+            if not os.path.isdir(folder):
+                inputs.append((folder, None, [], 'Not a folder'))
+                continue
+            names = sorted(os.listdir(folder))
+            rosters = [os.path.join(folder, name) for name in names if name.endswith('.xlsx') and not name.startswith('~$')]
+            pdfs = [os.path.join(folder, name) for name in names if name.lower().endswith('.pdf')]
+            error = None
+            if len(rosters) != 1:
+                error = f'Expected one roster (.xlsx), found {len(rosters)}'
+            elif not pdfs:
+                error = 'No PDF files found'
+            inputs.append((folder, rosters[0] if len(rosters) == 1 else None, pdfs, error))
+    return inputs
+
+def find_pdf_inputs(paths):
+    pdfs = []
+    for path in paths:
+        if os.path.isdir(path):
+            pdfs.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.lower().endswith('.pdf'))
+        else:
+            pdfs.append(path)
+    return pdfs
+
+def run_job(kind, params, input_path, output_dir, logger):
+    """Run one job through its handler in this process and return its report entry."""
+    job_id = f"cli-{uuid.uuid4()}"
+    collector = ErrorCollector()
+    logger.addHandler(collector)
+    start = time.perf_counter()
+    try:
+        app.job_status[job_id] = 'processing'
+        app.JOB_HANDLERS[kind](job_id, params, logger)
+    except Exception as e:
+        logger.error(f"Run for {input_path} failed: {e}")
+        app.job_status[job_id] = 'error'
+    finally:
+        logger.removeHandler(collector)
+    status = app.job_status.get(job_id)
+    entry = {
+        'input': input_path,
+        'kind': kind,
+        'output_dir': output_dir,
+        'status': status if status in ('completed', 'cancelled') else 'error',
+        'seconds': round(time.perf_counter() - start, 3),
+        'stats': app.job_stats.get(job_id, {}),
+        'spans': app.summarize_spans(app.job_spans.get(job_id)),
+        'errors': collector.messages
+    }
+    if kind in ('highlight', 'highlight_batch'):
+        entry['files'] = app.job_manifests.get(job_id, [])
+        entry['matches'] = sum(site['matches'] for site in entry['files'])
+    app.forget_job(job_id)
+    return entry
+
+def default_workers(pdf_paths):
+    # As on /process: a batch processes its PDFs in parallel
+    if len(pdf_paths) > 1:
+        return min(len(pdf_paths), os.cpu_count() or 1)
+    return app.app.config['HIGHLIGHT_WORKERS']
+
+def run_highlight(args, logger):
+    entries = []
+    for folder, roster_path, pdf_paths, error in find_highlight_inputs(args.inputs):
+        name = os.path.basename(os.path.normpath(folder))
+        output_dir = os.path.join(args.output, name)
+        if error:
+            logger.error(f"Skipping {folder}: {error}")
+            entries.append({'input': folder, 'kind': 'highlight', 'status': 'error', 'errors': [error]})
+            continue
+        kind, params = app.highlight_job_params(
+            roster_path,
+            pdf_paths,
+            output_dir,
+            highlight_type=args.type,
+            uan_column=args.uan_column,
+            esic_column=args.esic_column,
+            site_column=args.site_column,
+            border_color=app.parse_color(args.color),
+            highlight_mode=args.mode,
+            highlight_opacity=args.opacity,
+            workers=args.workers or default_workers(pdf_paths),
+            flatten=args.flatten,
+            save_profile=args.save_profile
+        )
+        logger.info(f"Highlighting {len(pdf_paths)} PDF(s) in {folder}")
+        entries.append(run_job(kind, params, folder, output_dir, logger))
+    return entries
+
+def run_pf(args, logger):
+    entries = []
+    os.makedirs(args.output, exist_ok=True)
+    for pdf_path in find_pdf_inputs(args.inputs):
+        base_filename = os.path.splitext(os.path.basename(pdf_path))[0]
+        params = {
+            'pdf_path': pdf_path,
+            'output_path': os.path.join(args.output, f"{base_filename}_name_mismatch.xlsx"),
+            'workers': args.workers,
+            'engine': args.engine
+        }
+        logger.info(f"Checking PF names in {pdf_path}")
+        entry = run_job('pf_mismatch', params, pdf_path, args.output, logger)
+        if entry['stats'].get('mismatches'):
+            entry['files'] = [os.path.basename(params['output_path'])]
+        entries.append(entry)
+    return entries
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    highlight = subparsers.add_parser('highlight', help='Highlight roster UAN/ESIC numbers by site')
+    highlight.add_argument('inputs', nargs='+', help='Folders holding one roster and its PDFs')
+    highlight.add_argument('--type', choices=sorted(app.HIGHLIGHT_TYPES) + ['both'], required=True)
+    highlight.add_argument('--uan-column', default='')
+    highlight.add_argument('--esic-column', default='')
+    highlight.add_argument('--site-column', required=True)
+    highlight.add_argument('--mode', choices=['border', 'highlight', 'underline'], default='border')
+    highlight.add_argument('--color', choices=sorted(app.HIGHLIGHT_COLORS), default='red')
+    highlight.add_argument('--opacity', type=float, default=0.25)
+    highlight.add_argument('--flatten', action='store_true', help='Draw marks into the page instead of annotations')
+    highlight.add_argument('--save-profile', choices=sorted(app.SAVE_PROFILES), default=app.app.config['SAVE_PROFILE'])
+    highlight.add_argument('--workers', type=int,
+                           help='Worker processes: sites of one PDF (default HIGHLIGHT_WORKERS), or PDFs '
+                                'of a folder with several (default one per PDF, up to the number of CPUs)')
+
+    pf = subparsers.add_parser('pf', help='Find PF ECR name mismatches')
+    pf.add_argument('inputs', nargs='+', help='PF ECR PDFs, or folders of them')
+    pf.add_argument('--engine', choices=sorted(app.ECR_EXTRACTION_ENGINES), default=app.app.config['PF_EXTRACT_ENGINE'])
+    pf.add_argument('--workers', type=int, default=app.app.config['PF_EXTRACT_WORKERS'],
+                    help='Worker processes reading ECR pages')
+
+    for subparser in (highlight, pf):
+        subparser.add_argument('--output', default='cli_outputs', help='Folder for outputs and the run report')
+        subparser.add_argument('--report', help=f'Run report path (default <output>/{REPORT_FILENAME})')
+        subparser.add_argument('--quiet', action='store_true', help='Only log warnings and errors')
+    args = parser.parse_args(argv)
+
+    if args.command == 'highlight' and (
+        (args.type in ('uan', 'both') and not args.uan_column) or
+        (args.type in ('esic', 'both') and not args.esic_column)
+    ):
+        parser.error(f"--type {args.type} needs the matching --uan-column/--esic-column")
+    if args.workers is not None:
+        args.workers = max(1, args.workers)
+
+    logging.basicConfig(
+        level=logging.WARNING if args.quiet else logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    logger = logging.getLogger()
+
+    started_at = datetime.now().isoformat()
+    start = time.perf_counter()
+    entries = run_highlight(args, logger) if args.command == 'highlight' else run_pf(args, logger)
+    report = {
+        'command': args.command,
+        'arguments': {key: value for key, value in vars(args).items() if key not in ('command', 'report', 'quiet')},
+        'started_at': started_at,
+        'seconds': round(time.perf_counter() - start, 3),
+        'runs': entries,
+        'completed': sum(1 for entry in entries if entry['status'] == 'completed'),
+        'failed': sum(1 for entry in entries if entry['status'] != 'completed')
+    }
+
+    report_path = args.report or os.path.join(args.output, REPORT_FILENAME)
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    logger.warning(
+        f"{report['completed']} of {len(entries)} runs completed in {report['seconds']:.2f}s; report: {report_path}"
+    )
+    return 0 if entries and not report['failed'] else 1
+
+if __name__ == '__main__':
+    # Required for the worker process pools in a frozen build
+    multiprocessing.freeze_support()
+    sys.exit(main())